@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import session
+
+# Load environment variables
+load_dotenv()
+
+# Monthly RapidAPI allowance for the Tank01 plan, and the share held back for manual runs and retries
+MONTHLY_QUOTA = int(os.getenv("RAPIDAPI_MONTHLY_QUOTA", "10000"))
+RESERVE_FRACTION = float(os.getenv("RAPIDAPI_RESERVE_FRACTION", "0.1"))
+
+# Expected calls per game or per kickoff slot at the normal cadence of each job
+LIVE_POLLS_PER_GAME = int(os.getenv("BUDGET_LIVE_POLLS_PER_GAME", "200"))
+INJURY_CALLS_PER_SLOT = int(os.getenv("BUDGET_INJURY_CALLS_PER_SLOT", "4"))
+SCHEDULE_CALLS_PER_SLOT = 1
+PLAYER_CALLS_PER_SLOT = 2
+
+# scorepicks and liveScoring poll the same box scores under one lock, so they share the scoring budget
+BUDGET_LINES = {"scorepicks": "scoring", "liveScoring": "scoring"}
+
+# Intervals are never stretched further than this
+MAX_INTERVAL_MULTIPLIER = float(os.getenv("BUDGET_MAX_INTERVAL_MULTIPLIER", "10"))
+
+# How long a computed budget is reused within one process
+BUDGET_REFRESH_SECONDS = int(os.getenv("BUDGET_REFRESH_SECONDS", "600"))
+
+_cached_budget = None
+_cached_at = 0.0
+_runs_table_ready = False
+
+# Function to get the first moment of the next month
+def end_of_month(now):
+    return (now.replace(day=1, hour=0, minute=0, second=0, microsecond=0) + timedelta(days=32)).replace(day=1)
+
+# Function to read this month's usage and the remaining schedule from the database
+def load_budget_inputs(now):
+    with session() as cursor:
+        cursor.execute("SELECT request_count FROM api_usage WHERE month_year = %s", (now.strftime("%Y-%m"),))
+        result = cursor.fetchone()
+        used = result[0] if result else 0
+
+        cursor.execute("""
+            SELECT COUNT(*), COUNT(DISTINCT game_time)
+            FROM games
+            WHERE game_time >= %s AND game_time < %s
+        """, (now, end_of_month(now)))
+        games, slots = cursor.fetchone()
+
+    return used, games, slots
+
+# Function to split the remaining monthly allowance between the jobs
+def plan_budget(used, games, slots, quota=MONTHLY_QUOTA, reserve_fraction=RESERVE_FRACTION):
+    spendable = int(quota * (1 - reserve_fraction))
+    available = max(spendable - used, 0)
+
+    planned = {
+        "scheduleUpdate": slots * SCHEDULE_CALLS_PER_SLOT,
+        "playerUpdate": slots * PLAYER_CALLS_PER_SLOT,
+        "injuryCheck": slots * INJURY_CALLS_PER_SLOT,
+        "scoring": games * LIVE_POLLS_PER_GAME,
+    }
+
+    # Pre-game jobs run once per slot and are funded first, then the injury poller, then scoring
+    allowances = {}
+    remaining = available
+    for job in ("scheduleUpdate", "playerUpdate", "injuryCheck", "scoring"):
+        allowances[job] = min(planned[job], remaining)
+        remaining -= allowances[job]
+
+    multipliers = {}
+    for job in ("injuryCheck", "scoring"):
+        if planned[job] <= allowances[job]:
+            multipliers[job] = 1.0
+        else:
+            multipliers[job] = min(planned[job] / max(allowances[job], 1), MAX_INTERVAL_MULTIPLIER)
+
+    return {
+        "quota": quota,
+        "spendable": spendable,
+        "used": used,
+        "available": available,
+        "games": games,
+        "slots": slots,
+        "planned": planned,
+        "allowances": allowances,
+        "multipliers": multipliers,
+        "projected_total": used + sum(planned.values()),
+    }
+
+# Function to get the current budget, recomputed at most every BUDGET_REFRESH_SECONDS
+def get_budget(force=False):
+    global _cached_budget, _cached_at
+    if force or _cached_budget is None or time.monotonic() - _cached_at > BUDGET_REFRESH_SECONDS:
+        used, games, slots = load_budget_inputs(datetime.now())
+        _cached_budget = plan_budget(used, games, slots)
+        _cached_at = time.monotonic()
+        multipliers = _cached_budget["multipliers"]
+        if any(multiplier > 1 for multiplier in multipliers.values()):
+            logging.warning(f"API usage is ahead of budget, stretching poll intervals: {multipliers}")
+    return _cached_budget
+
+# Function to get how much a poller should stretch its interval to stay within budget
+def interval_multiplier(job):
+    try:
+        return get_budget()["multipliers"].get(BUDGET_LINES.get(job, job), 1.0)
+    except Exception as e:
+        logging.error(f"Could not compute API budget, using normal intervals: {e}")
+        return 1.0
+
+# Function to decide whether a cron-fired poller should run now, given its normal interval and the budget
+def should_run(job, base_interval_minutes):
+    global _runs_table_ready
+    now = datetime.now()
+    multiplier = interval_multiplier(job)
+    min_gap = timedelta(minutes=base_interval_minutes * multiplier)
+
+    try:
+        with session() as cursor:
+            if not _runs_table_ready:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS api_budget_runs (
+                        job VARCHAR(64) NOT NULL PRIMARY KEY,
+                        last_run_at DATETIME NOT NULL
+                    )
+                """)
+                _runs_table_ready = True
+
+            cursor.execute("SELECT last_run_at FROM api_budget_runs WHERE job = %s", (job,))
+            result = cursor.fetchone()
+
+            # Only skip runs when behind budget, with a little slack so runs fired one interval apart still go ahead
+            if multiplier > 1 and result and now - result[0] < min_gap * 0.9:
+                logging.info(f"Skipping {job}: last run at {result[0]}, budget interval is {min_gap}.")
+                return False
+
+            cursor.execute("""
+                INSERT INTO api_budget_runs (job, last_run_at) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE last_run_at = VALUES(last_run_at)
+            """, (job, now))
+    except Exception as e:
+        # Never block a job because the budget bookkeeping is unavailable
+        logging.error(f"Could not check the API budget for {job}, running anyway: {e}")
+    return True
+
+# Function to print the projected spend for the rest of the month
+def print_report(budget):
+    print(f"Tank01 API budget for {datetime.now().strftime('%Y-%m')}")
+    print(f"  quota:            {budget['quota']}")
+    print(f"  used so far:      {budget['used']}")
+    print(f"  available:        {budget['available']} (after {RESERVE_FRACTION:.0%} reserve)")
+    print(f"  games remaining:  {budget['games']} in {budget['slots']} kickoff slots")
+    print("")
+    print(f"  {'job':<16}{'planned':>10}{'allowance':>12}{'interval x':>12}")
+    for job, planned in budget["planned"].items():
+        multiplier = budget["multipliers"].get(job, 1.0)
+        print(f"  {job:<16}{planned:>10}{budget['allowances'][job]:>12}{multiplier:>12.2f}")
+    print("")
+    projected = budget["projected_total"]
+    # The reserve is held back for manual runs and retries, so planned spend is measured against what is left of the quota
+    status = "within" if projected <= budget["spendable"] else "OVER"
+    print(f"  projected month total at normal cadence: {projected} ({status} the {budget['spendable']} spendable after the reserve)")
+    if status == "OVER":
+        print(f"  pollers will stretch their intervals; expected shortfall without stretching: {projected - budget['spendable']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the projected Tank01 API spend for the rest of the month (read only).")
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s", stream=sys.stderr)
+    print_report(get_budget(force=True))
@@ -0,0 +1,169 @@
+import os
+import sys
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from database import session, async_session
+
+# Name of the job making the calls, used to attribute usage per job
+JOB_NAME = os.path.splitext(os.path.basename(sys.argv[0] or "interactive"))[0]
+
+# Calls made in this process that have not been written to the database yet, keyed by (hour, endpoint)
+_pending_calls = Counter()
+_pending_lock = threading.Lock()
+_tables_ready = False
+_has_month_key = False
+
+CREATE_HOURLY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS api_usage_hourly (
+        hour_start DATETIME NOT NULL,
+        job VARCHAR(64) NOT NULL,
+        endpoint VARCHAR(64) NOT NULL,
+        request_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour_start, job, endpoint)
+    )
+"""
+
+# Whether api_usage has a unique key on month_year alone (added by migrations/001_api_usage_month_key.sql)
+MONTH_KEY_SQL = """
+    SELECT COUNT(*) FROM (
+        SELECT index_name FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = 'api_usage'
+        GROUP BY index_name
+        HAVING COUNT(*) = 1 AND MAX(column_name) = 'month_year' AND MAX(non_unique) = 0
+    ) month_keys
+"""
+
+# Only used when month_year is a unique key, otherwise every flush would add another row
+MONTHLY_UPSERT_SQL = """
+    INSERT INTO api_usage (month_year, request_count, request_time)
+    VALUES (%s, %s, NOW())
+    ON DUPLICATE KEY UPDATE request_count = request_count + VALUES(request_count), request_time = NOW()
+"""
+
+# Without the key, increment the month's row in place and only insert it when it does not exist yet
+MONTHLY_INCREMENT_SQL = """
+    UPDATE api_usage SET request_count = request_count + %s, request_time = NOW()
+    WHERE month_year = %s
+"""
+
+MONTHLY_INSERT_SQL = """
+    INSERT INTO api_usage (month_year, request_count, request_time)
+    VALUES (%s, %s, NOW())
+"""
+
+HOURLY_UPSERT_SQL = """
+    INSERT INTO api_usage_hourly (hour_start, job, endpoint, request_count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE request_count = request_count + VALUES(request_count)
+"""
+
+# Function to override the job name the calls are attributed to
+def set_job_name(name):
+    global JOB_NAME
+    JOB_NAME = name
+
+# Function to count an API call in process, to be written later by flush_api_usage()
+def record_api_call(endpoint, count=1):
+    hour_start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    with _pending_lock:
+        _pending_calls[(hour_start, endpoint)] += count
+
+# Function to report how many calls are waiting to be flushed
+def pending_api_calls():
+    with _pending_lock:
+        return sum(_pending_calls.values())
+
+# Function to take the pending counters and turn them into monthly and hourly rows
+def _take_pending_rows():
+    with _pending_lock:
+        pending = dict(_pending_calls)
+        _pending_calls.clear()
+
+    monthly = Counter()
+    hourly = []
+    for (hour_start, endpoint), count in pending.items():
+        monthly[hour_start.strftime("%Y-%m")] += count
+        hourly.append((hour_start, JOB_NAME, endpoint, count))
+    return pending, sorted(monthly.items()), hourly
+
+# Function to warn once that api_usage has no month_year key and the slower increment is used
+def _note_month_key(has_key):
+    global _has_month_key
+    _has_month_key = bool(has_key)
+    if not _has_month_key:
+        logging.warning("api_usage has no unique key on month_year, run migrations/001_api_usage_month_key.sql to enable the single-statement upsert.")
+
+# Function to put counters back if a flush failed, so the next flush includes them
+def _restore_pending(pending):
+    with _pending_lock:
+        _pending_calls.update(pending)
+
+# Function to write all pending API calls with one atomic increment per month and one upsert per hour/endpoint
+def flush_api_usage():
+    global _tables_ready
+    pending, monthly, hourly = _take_pending_rows()
+    if not pending:
+        return 0
+
+    try:
+        if not _tables_ready:
+            with session() as cursor:
+                cursor.execute(CREATE_HOURLY_TABLE_SQL)
+                cursor.execute(MONTH_KEY_SQL)
+                _note_month_key(cursor.fetchone()[0])
+            _tables_ready = True
+
+        with session() as cursor:
+            if _has_month_key:
+                cursor.executemany(MONTHLY_UPSERT_SQL, monthly)
+            else:
+                for month_year, count in monthly:
+                    cursor.execute(MONTHLY_INCREMENT_SQL, (count, month_year))
+                    if not cursor.rowcount:
+                        cursor.execute(MONTHLY_INSERT_SQL, (month_year, count))
+            cursor.executemany(HOURLY_UPSERT_SQL, hourly)
+    except Exception as e:
+        # Keep the counts so a later flush in this process can still write them
+        _restore_pending(pending)
+        logging.error(f"Failed to flush API usage: {e}")
+        return 0
+
+    total = sum(pending.values())
+    logging.info(f"API usage updated: {total} calls by {JOB_NAME} ({', '.join(f'{e}={c}' for (_, e), c in pending.items())}).")
+    return total
+
+# Asynchronous version of flush_api_usage() for jobs running on the async database pool
+async def async_flush_api_usage():
+    global _tables_ready
+    pending, monthly, hourly = _take_pending_rows()
+    if not pending:
+        return 0
+
+    try:
+        if not _tables_ready:
+            async with async_session() as cursor:
+                await cursor.execute(CREATE_HOURLY_TABLE_SQL)
+                await cursor.execute(MONTH_KEY_SQL)
+                _note_month_key((await cursor.fetchone())[0])
+            _tables_ready = True
+
+        async with async_session() as cursor:
+            if _has_month_key:
+                await cursor.executemany(MONTHLY_UPSERT_SQL, monthly)
+            else:
+                for month_year, count in monthly:
+                    await cursor.execute(MONTHLY_INCREMENT_SQL, (count, month_year))
+                    if not cursor.rowcount:
+                        await cursor.execute(MONTHLY_INSERT_SQL, (month_year, count))
+            await cursor.executemany(HOURLY_UPSERT_SQL, hourly)
+    except Exception as e:
+        # Keep the counts so a later flush in this process can still write them
+        _restore_pending(pending)
+        logging.error(f"Failed to flush API usage: {e}")
+        return 0
+
+    total = sum(pending.values())
+    logging.info(f"API usage updated: {total} calls by {JOB_NAME} ({', '.join(f'{e}={c}' for (_, e), c in pending.items())}).")
+    return total
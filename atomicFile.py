@@ -0,0 +1,24 @@
+import os
+import json
+import tempfile
+
+# Function to write a text file atomically, so readers in other processes never see a partial file.
+# The temporary file is removed again if anything fails before it replaces the old one.
+def write_text(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+# Function to write a JSON document atomically
+def write_json(path, data, separators=None):
+    write_text(path, json.dumps(data, separators=separators))
@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import mysql.connector
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_services import build_league, start_mock_services
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Jobs driven end to end, in the order a game day runs them
+JOBS = ["scheduleUpdate", "playerUpdate", "getPlayerInfo", "injuryCheck", "scorepicks", "leaderboard"]
+
+MIGRATIONS_DIR = os.path.join(REPO_DIR, "migrations")
+
+# Tables the jobs expect to exist already (the rest are created by the jobs themselves), as the baseline code used them.
+# Only the keys the baseline relied on are declared: players and games are upserted on their ids, picks are updated by id.
+# Pass --schema with a `mysqldump --no-data` of production to benchmark against its real tables and indexes instead.
+BASE_SCHEMA = [
+    """
+    CREATE TABLE users (
+        user_id INT NOT NULL PRIMARY KEY,
+        username VARCHAR(64) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE players (
+        player_id VARCHAR(32) NOT NULL PRIMARY KEY,
+        player_name VARCHAR(128),
+        team_name VARCHAR(8),
+        team_id VARCHAR(8),
+        position VARCHAR(8),
+        is_free_agent TINYINT NOT NULL DEFAULT 0,
+        injury_status VARCHAR(32),
+        headshot_url VARCHAR(255),
+        last_updated TIMESTAMP NULL,
+        byeweek VARCHAR(8)
+    )
+    """,
+    """
+    CREATE TABLE games (
+        game_id VARCHAR(32) NOT NULL PRIMARY KEY,
+        season_type VARCHAR(32),
+        week INT,
+        home_team VARCHAR(8),
+        away_team VARCHAR(8),
+        teamID_home VARCHAR(8),
+        teamID_away VARCHAR(8),
+        game_time DATETIME NULL,
+        game_status VARCHAR(32),
+        game_status_code INT,
+        neutral_site TINYINT,
+        espn_link VARCHAR(255),
+        cbs_link VARCHAR(255),
+        last_updated TIMESTAMP NULL,
+        season VARCHAR(8)
+    )
+    """,
+    """
+    CREATE TABLE picks (
+        id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        week INT NOT NULL,
+        game_id VARCHAR(32) NOT NULL,
+        player_id VARCHAR(32) NOT NULL,
+        is_successful TINYINT NOT NULL DEFAULT 0,
+        Is_injured TINYINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE pick_window (
+        id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        week INT NOT NULL,
+        season INT NOT NULL,
+        day_name VARCHAR(16),
+        start_time DATETIME NOT NULL,
+        is_open TINYINT NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP NULL
+    )
+    """,
+    """
+    CREATE TABLE leaderboard (
+        user_id INT NOT NULL,
+        week INT NOT NULL,
+        points_week INT NOT NULL DEFAULT 0,
+        total_points INT NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP NULL
+    )
+    """,
+    """
+    CREATE TABLE api_usage (
+        month_year VARCHAR(7) NOT NULL,
+        request_count INT NOT NULL DEFAULT 0,
+        request_time DATETIME NULL
+    )
+    """,
+]
+
+# Function to read the MySQL server the throwaway benchmark database is created on
+def server_config():
+    return {
+        "host": os.getenv("BENCH_MYSQL_HOST", "127.0.0.1"),
+        "port": int(os.getenv("BENCH_MYSQL_PORT", "3306")),
+        "user": os.getenv("BENCH_MYSQL_USER", "root"),
+        "password": os.getenv("BENCH_MYSQL_PASSWORD", ""),
+    }
+
+# Function to split a SQL file (a migration or a mysqldump) into its statements, dropping comment lines
+def sql_statements(path):
+    with open(path, "r", encoding="utf-8") as f:
+        sql = "\n".join(line for line in f.read().splitlines() if not line.lstrip().startswith("--"))
+    return [statement.strip() for statement in sql.split(";") if statement.strip()]
+
+# Function to list the SQL migrations an operator runs on deploy, in order
+def migration_files():
+    return sorted(
+        os.path.join(MIGRATIONS_DIR, name) for name in os.listdir(MIGRATIONS_DIR)
+        if name.endswith(".sql")
+    )
+
+# Function to create the throwaway database and seed it with the league's users, picks and leaderboard rows.
+# The schema comes from the given dump or BASE_SCHEMA, then the migrations are applied as they are on deploy.
+def create_database(name, league, schema_path=None, migrate=True):
+    connection = mysql.connector.connect(**server_config())
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE `{name}`")
+    cursor.execute(f"USE `{name}`")
+    for statement in (sql_statements(schema_path) if schema_path else BASE_SCHEMA):
+        cursor.execute(statement)
+    if migrate:
+        for path in migration_files():
+            print(f"Applying {os.path.relpath(path, REPO_DIR)}")
+            for statement in sql_statements(path):
+                cursor.execute(statement)
+
+    cursor.executemany("INSERT INTO users (user_id, username) VALUES (%s, %s)", league["users"])
+    cursor.executemany("INSERT INTO picks (user_id, week, game_id, player_id) VALUES (%s, %s, %s, %s)", league["picks"])
+    cursor.executemany(
+        "INSERT INTO leaderboard (user_id, week) VALUES (%s, %s)",
+        sorted({(user_id, week) for user_id, week, _, _ in league["picks"]})
+    )
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+# Function to drop the throwaway database
+def drop_database(name):
+    connection = mysql.connector.connect(**server_config())
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+    cursor.close()
+    connection.close()
+
+# Function to read the server's count of statements received, which includes the one reading it
+def statements_executed(cursor):
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    return int(cursor.fetchone()[1])
+
+# Function to build the environment a job runs in, pointing every dependency at the mocks and the benchmark database
+def job_environment(database, urls, league):
+    config = server_config()
+    env = dict(os.environ)
+    env.update({
+        "MYSQL_HOST": config["host"],
+        "MYSQL_PORT": str(config["port"]),
+        "MYSQL_USER": config["user"],
+        "MYSQL_PASSWORD": config["password"],
+        "MYSQL_DB": database,
+        # The benchmark server is local and runs without SSL
+        "MYSQL_SSL_DISABLED": "1",
+        "RAPIDAPI_KEY": "bench",
+        "TANK01_BASE_URL": urls["tank01"],
+        "WEBHOOK_BASE_URL": urls["webhook"],
+        "WEBHOOK_SECRET": "bench",
+        "DISCORD_API_BASE": urls["discord"],
+        "DISCORD_BOT_TOKEN": "bench",
+        "DISCORD_CHANNEL_ID": "1000",
+        "NFL_SEASON": league["season"],
+        "RAPIDAPI_MONTHLY_QUOTA": "100000000",
+        "JOB_LOCK_BACKEND": "file",
+        "METRICS_FORMAT": "json",
+        "METRICS_DIR": "logs/metrics",
+    })
+    return env
+
+# Function to run one job as a child process, returning its exit code, wall time and peak RSS in bytes
+def run_job(job, env, workdir):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, f"{job}.py")], cwd=workdir, env=env)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return process.returncode, wall_seconds, peak_rss
+
+# Function to read the metrics summary the job's instrumentation wrote when it ended, if any
+def job_metrics(job, workdir):
+    try:
+        with open(os.path.join(workdir, "logs", "metrics", f"{job}.jsonl"), "r", encoding="utf-8") as f:
+            return json.loads(f.readlines()[-1])
+    except (OSError, ValueError, IndexError):
+        return {}
+
+# Function to format the calls one job made to the mocks
+def format_calls(calls):
+    return ", ".join(f"{name}={count}" for name, count in sorted(calls.items())) or "-"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the jobs end to end against mock APIs and a throwaway database.")
+    parser.add_argument("--players", type=int, default=2500, help="Players in the synthetic league")
+    parser.add_argument("--games", type=int, default=272, help="Regular season games")
+    parser.add_argument("--users", type=int, default=200, help="League members")
+    parser.add_argument("--picks-per-user", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--jobs", nargs="+", default=JOBS, choices=JOBS, help="Jobs to run, in order")
+    parser.add_argument("--rounds", type=int, default=2, help="Times the job list is run; later rounds show steady-state cost")
+    parser.add_argument("--webhook-port", type=int, default=3000)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database and working directory")
+    parser.add_argument("--schema", help="mysqldump --no-data of production to create the tables from, instead of BASE_SCHEMA")
+    parser.add_argument("--skip-migrations", action="store_true", help="Do not apply migrations/*.sql (the schema dump already has them)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    league = build_league(args.players, args.games, args.users, args.picks_per_user, args.seed)
+    database = f"td_bench_{os.getpid()}"
+    workdir = tempfile.mkdtemp(prefix="td_bench_")
+    os.makedirs(os.path.join(workdir, "logs"))
+
+    print(f"League: season {league['season']}, {len(league['games'])} games, {len(league['players'])} players, "
+          f"{len(league['users'])} users, {len(league['picks'])} picks, current week {league['current_week']}")
+    print(f"Database {database}, working directory {workdir}")
+
+    create_database(database, league, args.schema, not args.skip_migrations)
+    urls, calls, stop_mocks = start_mock_services(league, webhook_port=args.webhook_port)
+    env = job_environment(database, urls, league)
+
+    status_connection = mysql.connector.connect(**server_config())
+    status_cursor = status_connection.cursor()
+
+    results = []
+    try:
+        for round_number in range(1, args.rounds + 1):
+            for job in args.jobs:
+                calls_before = dict(calls)
+                statements_before = statements_executed(status_cursor)
+
+                exit_code, wall_seconds, peak_rss = run_job(job, env, workdir)
+
+                # One of the statements counted is our own SHOW STATUS
+                statements = statements_executed(status_cursor) - statements_before - 1
+                job_calls = {name: count - calls_before.get(name, 0) for name, count in calls.items() if count != calls_before.get(name, 0)}
+                metrics = job_metrics(job, workdir)
+                results.append({
+                    "round": round_number,
+                    "job": job,
+                    "exit_code": exit_code,
+                    "wall_seconds": round(wall_seconds, 3),
+                    "sql_statements": statements,
+                    "sql_seconds": metrics.get("sql_seconds"),
+                    "top_statements": metrics.get("sql", [])[:3],
+                    "calls": job_calls,
+                    "peak_rss_mib": round(peak_rss / 2 ** 20, 1),
+                })
+    finally:
+        status_cursor.close()
+        status_connection.close()
+        stop_mocks()
+        if not args.keep:
+            drop_database(database)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'Rnd':>3} {'Job':<15} {'Exit':>4} {'Wall s':>8} {'SQL':>7} {'SQL s':>7} {'RSS MiB':>8}  Calls")
+    for result in results:
+        sql_seconds = f"{result['sql_seconds']:.3f}" if result['sql_seconds'] is not None else "-"
+        print(f"{result['round']:>3} {result['job']:<15} {result['exit_code']:>4} {result['wall_seconds']:>8.3f} "
+              f"{result['sql_statements']:>7} {sql_seconds:>7} {result['peak_rss_mib']:>8.1f}  {format_calls(result['calls'])}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"league": {key: league[key] for key in ("season", "weeks", "current_week")}, "results": results}, f, indent=2)
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tank01
+import rosterSync
+
+# Function to build a synthetic getNFLPlayerList response shaped like the real one
+def build_payload(players, seed):
+    rng = random.Random(seed)
+    teams = [f"T{t:02d}" for t in range(32)]
+    body = []
+    for n in range(players):
+        team = rng.choice(teams)
+        body.append({
+            "playerID": str(3000000 + n),
+            "longName": f"Player Number {n}",
+            "team": team,
+            "teamID": str(teams.index(team) + 1),
+            "pos": rng.choice(["QB", "RB", "WR", "TE", "K", "DEF"]),
+            "isFreeAgent": "False",
+            "injury": {"designation": rng.choice(["", "", "", "Questionable", "Out"]), "description": "", "injDate": ""},
+            "espnHeadshot": f"https://a.espncdn.com/i/headshots/nfl/players/full/{3000000 + n}.png",
+            "espnID": str(4000000 + n),
+            "sleeperBotID": str(5000000 + n),
+            "school": "Somewhere State",
+            "bDay": "1/1/1999",
+            "height": "6'2\"",
+            "weight": "215",
+            "exp": str(rng.randint(0, 15)),
+            "jerseyNum": str(rng.randint(1, 99)),
+        })
+    return json.dumps({"statusCode": 200, "body": body}).encode("utf-8")
+
+# Asynchronous generator replaying the payload as network chunks
+async def replay_chunks(payload, chunk_size):
+    for start in range(0, len(payload), chunk_size):
+        yield payload[start:start + chunk_size]
+
+# The previous approach: decode the whole document, then build every row
+def parse_whole(payload, team_mapping):
+    players = json.loads(payload).get("body", [])
+    rows = [rosterSync.player_row(player, team_mapping) for player in players]
+    return len(rows)
+
+# The streaming approach: rows are built and handed off one batch at a time
+async def parse_streamed(payload, team_mapping, chunk_size, batch_size):
+    total = 0
+    items = (item async for item, _ in tank01.iter_body_items(replay_chunks(payload, chunk_size)))
+    async for batch in rosterSync.stream_batches(items, batch_size):
+        rows = [rosterSync.player_row(player, team_mapping) for player in batch]
+        total += len(rows)
+    return total
+
+# Function to measure the peak memory allocated while running fn
+def traced_peak(fn):
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of whole-document and streamed player list parsing.")
+    parser.add_argument("--players", type=int, default=3000)
+    parser.add_argument("--chunk-size", type=int, default=tank01.STREAM_CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=rosterSync.ROSTER_SYNC_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    payload = build_payload(args.players, args.seed)
+    team_mapping = {f"T{t:02d}": t % 14 + 5 for t in range(32)}
+
+    whole_rows, whole_peak = traced_peak(lambda: parse_whole(payload, team_mapping))
+    streamed_rows, streamed_peak = traced_peak(
+        lambda: asyncio.run(parse_streamed(payload, team_mapping, args.chunk_size, args.batch_size))
+    )
+    assert whole_rows == streamed_rows == args.players
+
+    print(f"payload: {args.players} players, {len(payload) / 1024 / 1024:.2f} MiB (not counted in the peaks below)")
+    print(f"whole document: {whole_peak / 1024 / 1024:8.2f} MiB peak")
+    print(f"streamed:       {streamed_peak / 1024 / 1024:8.2f} MiB peak ({args.chunk_size // 1024} KiB chunks, batches of {args.batch_size})")
+    print(f"reduction:      {whole_peak / streamed_peak:8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import random
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scorepicks
+
+# Function to build a synthetic Sunday slate: games, pending picks and each game's scoring plays
+def build_slate(games, users, plays_per_game, players_per_game, seed):
+    rng = random.Random(seed)
+    game_ids = [f"20241020_T{g:02d}@H{g:02d}" for g in range(games)]
+    roster = {game_id: [str(4000000 + g * 1000 + p) for p in range(players_per_game)] for g, game_id in enumerate(game_ids)}
+
+    picks = []
+    for user_id in range(users):
+        game_id = rng.choice(game_ids)
+        picks.append({
+            "id": user_id + 1,
+            "user_id": user_id,
+            "week": 7,
+            "game_id": game_id,
+            "player_id": int(rng.choice(roster[game_id])),
+        })
+
+    changes = {}
+    for game_id in game_ids:
+        new_plays = []
+        for n in range(plays_per_game):
+            scorers = rng.sample(roster[game_id], 2)
+            play = {
+                "scoreType": rng.choice(["TD", "TD", "FG"]),
+                "playerIDs": scorers,
+                "playerName": f"Player {scorers[0]}",
+                "scorePeriod": f"Q{n % 4 + 1}",
+                "scoreTime": f"{n}:00",
+            }
+            new_plays.append((scorepicks.play_fingerprint(play), play))
+        changes[game_id] = {"new_plays": new_plays}
+
+    return scorepicks.group_picks_by_game(picks), changes
+
+# The previous matcher: every pick tested against every play with a substring check
+def nested_scan(picks_by_game, changes):
+    scored = {}
+    for game_id, change in changes.items():
+        for fingerprint, play in change["new_plays"]:
+            if play["scoreType"] != "TD":
+                continue
+            for pick in picks_by_game.get(game_id, []):
+                if str(pick['player_id']) in play["playerIDs"]:
+                    scored[pick['id']] = pick
+    return scored
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare touchdown matching strategies on a synthetic Sunday slate.")
+    parser.add_argument("--games", type=int, default=14)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--plays-per-game", type=int, default=12)
+    parser.add_argument("--players-per-game", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    picks_by_game, changes = build_slate(args.games, args.users, args.plays_per_game, args.players_per_game, args.seed)
+
+    # Both matchers must agree before their timings mean anything
+    indexed, _ = scorepicks.find_scoring_picks(picks_by_game, changes)
+    assert set(indexed) == set(nested_scan(picks_by_game, changes))
+
+    nested_time = min(timeit.repeat(lambda: nested_scan(picks_by_game, changes), number=1, repeat=args.repeat))
+    indexed_time = min(timeit.repeat(lambda: scorepicks.find_scoring_picks(picks_by_game, changes), number=1, repeat=args.repeat))
+
+    print(f"slate: {args.games} games, {args.users} picks, {args.plays_per_game} plays/game, {len(indexed)} picks scored")
+    print(f"nested scan:    {nested_time * 1000:8.3f} ms")
+    print(f"indexed lookup: {indexed_time * 1000:8.3f} ms")
+    print(f"speedup:        {nested_time / indexed_time:8.1f}x")
+
+if __name__ == "__main__":
+    main()
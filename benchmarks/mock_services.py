@@ -0,0 +1,276 @@
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from aiohttp import web
+
+NUM_TEAMS = 32
+GAMES_PER_WEEK = 16
+SKILL_POSITIONS = ["QB", "RB", "RB", "WR", "WR", "WR", "TE", "TE", "K"]
+OTHER_POSITIONS = ["OL", "DL", "LB", "CB", "S", "P", "LS"]
+INJURY_DESIGNATIONS = [""] * 14 + ["Questionable", "Doubtful", "Out", "Injured Reserve"]
+
+# Kickoff slots of a week, as (days after the Thursday game, Tank01 ET clock)
+WEEK_SLOTS = [(0, "8:15p"), (3, "9:30a"), (3, "1:00p"), (3, "1:00p"), (3, "1:00p"), (3, "1:00p"), (3, "1:00p"),
+              (3, "1:00p"), (3, "1:00p"), (3, "4:05p"), (3, "4:25p"), (3, "4:25p"), (3, "4:25p"), (3, "8:20p"),
+              (4, "8:15p"), (4, "8:15p")]
+
+# Function to build a synthetic league: teams, players, a season schedule, box scores, users and their picks.
+# Weeks are laid out around `today` so that some games are finished, one week is current and the rest are ahead.
+def build_league(players=2500, games=272, users=200, picks_per_user=6, seed=1, today=None):
+    rng = random.Random(seed)
+    today = today or date.today()
+    weeks = max(1, min(18, -(-games // GAMES_PER_WEEK)))
+    season = str(today.year if today.month >= 3 else today.year - 1)
+
+    # The current week is in the middle of the schedule, each week starts on a Thursday
+    first_thursday = today - timedelta(days=(today.weekday() - 3) % 7) - timedelta(weeks=weeks // 2)
+
+    teams = []
+    for number in range(1, NUM_TEAMS + 1):
+        abv = f"T{number:02d}"
+        teams.append({
+            "teamAbv": abv,
+            "teamID": str(number),
+            "teamCity": f"City {number}",
+            "teamName": f"Team {number}",
+            "byeWeeks": {season: [str(rng.randint(5, 14))]},
+        })
+
+    roster = {team["teamAbv"]: [] for team in teams}
+    player_list = []
+    for number in range(players):
+        team = teams[number % NUM_TEAMS]
+        player_id = str(3900000 + number)
+        position = rng.choice(SKILL_POSITIONS if number % 3 else OTHER_POSITIONS)
+        player_list.append({
+            "playerID": player_id,
+            "longName": f"Player {number:05d}",
+            "team": team["teamAbv"],
+            "teamID": team["teamID"],
+            "pos": position,
+            "isFreeAgent": "False",
+            "injury": {"designation": rng.choice(INJURY_DESIGNATIONS), "description": "", "injDate": ""},
+            "espnHeadshot": f"https://a.espncdn.com/i/headshots/nfl/players/full/{player_id}.png",
+            "espnID": str(4900000 + number),
+        })
+        if position in SKILL_POSITIONS:
+            roster[team["teamAbv"]].append(player_list[-1])
+
+    schedule = []
+    box_scores = {}
+    for week in range(1, weeks + 1):
+        thursday = first_thursday + timedelta(weeks=week - 1)
+        order = [team["teamAbv"] for team in teams]
+        rng.shuffle(order)
+        for slot in range(min(GAMES_PER_WEEK, games - len(schedule))):
+            away, home = order[slot * 2], order[slot * 2 + 1]
+            days, clock = WEEK_SLOTS[slot]
+            game_date = (thursday + timedelta(days=days)).strftime("%Y%m%d")
+            game_id = f"{game_date}_{away}@{home}"
+            finished = thursday + timedelta(days=days) < today
+            schedule.append({
+                "gameID": game_id,
+                "seasonType": "Regular Season",
+                "away": away,
+                "home": home,
+                "teamIDAway": str(int(away[1:])),
+                "teamIDHome": str(int(home[1:])),
+                "gameDate": game_date,
+                "gameTime": clock,
+                "gameWeek": f"Week {week}",
+                "gameStatus": "Completed" if finished else "Scheduled",
+                "gameStatusCode": "2" if finished else "0",
+                "neutralSite": "False",
+                "season": season,
+                "espnLink": f"https://www.espn.com/nfl/game/_/gameId/{game_id}",
+                "cbsLink": f"https://www.cbssports.com/nfl/gametracker/recap/NFL_{game_id}",
+            })
+
+            scoring_plays = []
+            if finished:
+                for number in range(rng.randint(3, 9)):
+                    team = rng.choice((away, home))
+                    scorer = rng.choice(roster[team])
+                    touchdown = rng.random() < 0.7
+                    scoring_plays.append({
+                        "scorePeriod": f"Q{number % 4 + 1}",
+                        "scoreTime": f"{rng.randint(0, 14)}:{rng.randint(0, 59):02d}",
+                        "team": team,
+                        "scoreType": "TD" if touchdown else "FG",
+                        "playerIDs": [scorer["playerID"]],
+                        "playerName": scorer["longName"],
+                    })
+            box_scores[game_id] = {
+                "gameID": game_id,
+                "gameStatus": schedule[-1]["gameStatus"],
+                "gameStatusCode": schedule[-1]["gameStatusCode"],
+                "scoringPlays": scoring_plays,
+            }
+
+    # Users pick players from games up to the current week, so scoring and injury checks have work to do
+    current_week = weeks // 2 + 1
+    pickable = [game for game in schedule if int(game["gameWeek"].split()[1]) <= current_week]
+    user_rows = [(user_id, f"user{user_id:05d}") for user_id in range(1, users + 1)]
+    pick_rows = []
+    for user_id, _ in user_rows:
+        for game in rng.sample(pickable, min(picks_per_user, len(pickable))):
+            player = rng.choice(roster[rng.choice((game["away"], game["home"]))])
+            pick_rows.append((user_id, int(game["gameWeek"].split()[1]), game["gameID"], player["playerID"]))
+
+    return {
+        "season": season,
+        "weeks": weeks,
+        "current_week": current_week,
+        "teams": teams,
+        "players": player_list,
+        "games": schedule,
+        "box_scores": box_scores,
+        "users": user_rows,
+        "picks": pick_rows,
+    }
+
+# Function to serialise a Tank01 style response with an ETag, so the client's revalidation path is exercised too
+def tank01_response(request, body):
+    payload = json.dumps({"statusCode": 200, "body": body}).encode("utf-8")
+    etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers={"ETag": etag})
+    return web.Response(body=payload, content_type="application/json", headers={"ETag": etag})
+
+# Function to build the mock Tank01 API, counting calls per endpoint in stats
+def build_tank01_app(league, stats):
+    players_by_id = {player["playerID"]: player for player in league["players"]}
+    games_by_week = {}
+    for game in league["games"]:
+        games_by_week.setdefault(game["gameWeek"].split()[1], []).append(game)
+
+    async def get_teams(request):
+        stats["getNFLTeams"] += 1
+        return tank01_response(request, league["teams"])
+
+    async def get_player_list(request):
+        stats["getNFLPlayerList"] += 1
+        player_ids = request.query.get("playerIDs")
+        if player_ids:
+            return tank01_response(request, [players_by_id[pid] for pid in player_ids.split(",") if pid in players_by_id])
+        return tank01_response(request, league["players"])
+
+    async def get_games_for_week(request):
+        stats["getNFLGamesForWeek"] += 1
+        week = request.query.get("week", "all")
+        return tank01_response(request, league["games"] if week == "all" else games_by_week.get(week, []))
+
+    async def get_box_score(request):
+        stats["getNFLBoxScore"] += 1
+        box_score = league["box_scores"].get(request.query.get("gameID"))
+        if box_score is None:
+            return web.json_response({"statusCode": 404, "error": "Unknown gameID"}, status=404)
+        return tank01_response(request, box_score)
+
+    app = web.Application()
+    app.router.add_get("/getNFLTeams", get_teams)
+    app.router.add_get("/getNFLPlayerList", get_player_list)
+    app.router.add_get("/getNFLGamesForWeek", get_games_for_week)
+    app.router.add_get("/getNFLBoxScore", get_box_score)
+    return app
+
+# Function to build the mock webhook receiver of the bot
+def build_webhook_app(stats):
+    async def receive(request):
+        await request.read()
+        stats[f"webhook {request.match_info['kind']}"] += 1
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/webhook/{kind}", receive)
+    return app
+
+# Function to build the mock Discord API, with rate limit headers that never run out
+def build_discord_app(stats):
+    next_id = iter(range(10 ** 17, 10 ** 18))
+    rate_limit_headers = {"X-RateLimit-Bucket": "bench", "X-RateLimit-Remaining": "100", "X-RateLimit-Reset-After": "0"}
+
+    async def post_message(request):
+        await request.read()
+        stats["discord POST"] += 1
+        return web.json_response({"id": str(next(next_id))}, headers=rate_limit_headers)
+
+    async def edit_message(request):
+        await request.read()
+        stats["discord PATCH"] += 1
+        return web.json_response({"id": request.match_info["message_id"]}, headers=rate_limit_headers)
+
+    async def delete_message(request):
+        stats["discord DELETE"] += 1
+        return web.Response(status=204, headers=rate_limit_headers)
+
+    app = web.Application()
+    app.router.add_post("/channels/{channel_id}/messages", post_message)
+    app.router.add_patch("/channels/{channel_id}/messages/{message_id}", edit_message)
+    app.router.add_delete("/channels/{channel_id}/messages/{message_id}", delete_message)
+    return app
+
+# Function to start the mock Tank01, webhook and Discord services on a background event loop.
+# Returns their base URLs, the shared call counter and a function that stops them.
+def start_mock_services(league, host="127.0.0.1", tank01_port=0, webhook_port=3000, discord_port=0):
+    stats = Counter()
+    loop = asyncio.new_event_loop()
+    runners = []
+
+    async def start(app, port):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+        return f"http://{host}:{runner.addresses[0][1]}"
+
+    async def start_all():
+        return {
+            "tank01": await start(build_tank01_app(league, stats), tank01_port),
+            "webhook": await start(build_webhook_app(stats), webhook_port),
+            "discord": await start(build_discord_app(stats), discord_port),
+        }
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    urls = asyncio.run_coroutine_threadsafe(start_all(), loop).result()
+
+    def stop():
+        async def cleanup():
+            for runner in runners:
+                await runner.cleanup()
+        asyncio.run_coroutine_threadsafe(cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return urls, stats, stop
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock Tank01, webhook and Discord APIs for a synthetic league.")
+    parser.add_argument("--players", type=int, default=2500)
+    parser.add_argument("--games", type=int, default=272)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--picks-per-user", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tank01-port", type=int, default=8001)
+    parser.add_argument("--webhook-port", type=int, default=3000)
+    parser.add_argument("--discord-port", type=int, default=8002)
+    args = parser.parse_args()
+
+    league = build_league(args.players, args.games, args.users, args.picks_per_user, args.seed)
+    urls, stats, stop = start_mock_services(league, tank01_port=args.tank01_port, webhook_port=args.webhook_port, discord_port=args.discord_port)
+    print(f"Serving season {league['season']} ({len(league['games'])} games, {len(league['players'])} players), "
+          f"current week {league['current_week']}")
+    print(f"TANK01_BASE_URL={urls['tank01']}\nWEBHOOK_BASE_URL={urls['webhook']}\nDISCORD_API_BASE={urls['discord']}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"{datetime.now():%H:%M:%S} calls so far: {dict(stats)}")
+    except KeyboardInterrupt:
+        stop()
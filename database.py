@@ -1,31 +1,267 @@
 import mysql.connector
+import mysql.connector.aio
+from mysql.connector import pooling
 import os
 import base64
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
 from dotenv import load_dotenv
+import instrumentation
 
 # Load environment variables
 load_dotenv()
 
-# Function to get database connection
-def get_db_connection():
-    db_config = {
+# Pool settings (mysql-connector allows at most 32 connections per pool)
+POOL_NAME = "td_showdown"
+POOL_SIZE = min(int(os.getenv("MYSQL_POOL_SIZE", "5")), 32)
+POOL_WAIT_TIMEOUT = float(os.getenv("MYSQL_POOL_WAIT_TIMEOUT", "10"))
+POOL_WAIT_STEP = 0.05
+ASYNC_POOL_SIZE = int(os.getenv("MYSQL_ASYNC_POOL_SIZE", "5"))
+
+# Connecting without SSL has to be asked for explicitly, it is only meant for local databases such as the benchmark one
+SSL_DISABLED = os.getenv("MYSQL_SSL_DISABLED") == "1"
+
+_pool = None
+_pool_opened = 0
+_pool_lock = threading.Lock()
+_pool_metrics = {
+    "checkouts": 0,
+    "in_use": 0,
+    "peak_in_use": 0,
+    "waits": 0,
+    "timeouts": 0,
+    "total_wait_seconds": 0.0,
+    "max_wait_seconds": 0.0,
+}
+
+# Async pool state, bound to the event loop of the job that first uses it
+_async_idle = None
+_async_created = 0
+_async_pool_metrics = dict(_pool_metrics)
+
+# Function to decode the SSL certificate once per process
+@lru_cache(maxsize=1)
+def get_ssl_ca():
+    # Use SSL certificate content directly from environment variable
+    cert_content = os.getenv("SSL_CERT_CONTENT")
+    if not cert_content:
+        return None
+    return base64.b64decode(cert_content).decode("utf-8")
+
+# Function to build the connection settings shared by every connection
+def get_db_config():
+    config = {
         "host": os.getenv("MYSQL_HOST"),
         "user": os.getenv("MYSQL_USER"),
         "password": os.getenv("MYSQL_PASSWORD"),
         "database": os.getenv("MYSQL_DB"),
-        "port": os.getenv("MYSQL_PORT"),
+        "port": int(os.getenv("MYSQL_PORT", "3306")),
     }
+    if SSL_DISABLED:
+        config["ssl_disabled"] = True
+        return config
 
-    # Use SSL certificate content directly from environment variable
-    ssl_ca = base64.b64decode(os.getenv("SSL_CERT_CONTENT")).decode("utf-8")
+    ssl_ca = get_ssl_ca()
+    if not ssl_ca:
+        raise ValueError("SSL_CERT_CONTENT is not set. Set MYSQL_SSL_DISABLED=1 to connect to a local database without SSL.")
+    config["ssl_ca"] = ssl_ca
+    return config
 
-    # Add SSL config to the database connection
-    db_config["ssl_ca"] = ssl_ca
+# Function to get the process-wide connection pool, creating it empty on first use.
+# Connections are opened as they are needed, so a one-shot job only opens as many as it uses at once.
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool = pooling.MySQLConnectionPool(pool_name=POOL_NAME, pool_size=POOL_SIZE)
+            pool.set_config(**get_db_config())
+            _pool = pool
+    return _pool
 
+# Function to open one more pooled connection if the pool is not full yet, returning whether it did
+def _open_connection(pool):
+    global _pool_opened
+    with _pool_lock:
+        if _pool_opened >= POOL_SIZE:
+            return False
+        _pool_opened += 1
     try:
-        connection = mysql.connector.connect(**db_config)
+        pool.add_connection()
+    except mysql.connector.Error as err:
+        with _pool_lock:
+            _pool_opened -= 1
+        print(f"Error connecting to the database: {err}")
+        raise
+    if _pool_opened == 1:
         print("Successfully connected to the database")
-        return connection
+        logging.info(f"Opened database connection pool '{POOL_NAME}' with up to {POOL_SIZE} connections.")
+    return True
+
+# Function to check a connection out of the pool, waiting up to POOL_WAIT_TIMEOUT for one to free up
+def _checkout():
+    pool = get_pool()
+    start = time.monotonic()
+    waited = False
+
+    while True:
+        try:
+            connection = pool.get_connection()
+            break
+        except pooling.PoolError:
+            if _open_connection(pool):
+                continue
+            waited = True
+            if time.monotonic() - start >= POOL_WAIT_TIMEOUT:
+                with _pool_lock:
+                    _pool_metrics["timeouts"] += 1
+                logging.error(f"Timed out after {POOL_WAIT_TIMEOUT}s waiting for a database connection.")
+                raise
+            time.sleep(POOL_WAIT_STEP)
+
+    wait_seconds = time.monotonic() - start
+    with _pool_lock:
+        _pool_metrics["checkouts"] += 1
+        _pool_metrics["in_use"] += 1
+        _pool_metrics["peak_in_use"] = max(_pool_metrics["peak_in_use"], _pool_metrics["in_use"])
+        if waited:
+            _pool_metrics["waits"] += 1
+        _pool_metrics["total_wait_seconds"] += wait_seconds
+        _pool_metrics["max_wait_seconds"] = max(_pool_metrics["max_wait_seconds"], wait_seconds)
+    return connection
+
+# Function to hand a connection back to the pool
+def _release(connection):
+    with _pool_lock:
+        _pool_metrics["in_use"] -= 1
+    connection.close()
+
+# Function to get database connection (a pooled connection, close() returns it to the pool)
+def get_db_connection():
+    connection = _checkout()
+    # Callers of this function close the connection themselves, so it is not counted as in use
+    with _pool_lock:
+        _pool_metrics["in_use"] -= 1
+    return connection
+
+# Context manager yielding a cursor on a pooled connection, committing on success and rolling back on error
+@contextmanager
+def session(dictionary=False):
+    connection = _checkout()
+    cursor = instrumentation.instrument_cursor(connection.cursor(dictionary=dictionary))
+    try:
+        yield cursor
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        _release(connection)
+
+# Asynchronous function to open a new non-blocking database connection (the caller closes it)
+async def get_async_db_connection():
+    try:
+        return await mysql.connector.aio.connect(**get_db_config())
     except mysql.connector.Error as err:
         print(f"Error connecting to the database: {err}")
-        raise
\ No newline at end of file
+        raise
+
+# Asynchronous function to check a connection out of the async pool, opening one if the pool is not full yet
+async def _async_checkout():
+    global _async_idle, _async_created
+    if _async_idle is None:
+        _async_idle = asyncio.Queue()
+
+    start = time.monotonic()
+    waited = False
+
+    if _async_idle.empty() and _async_created < ASYNC_POOL_SIZE:
+        _async_created += 1
+        try:
+            connection = await get_async_db_connection()
+        except Exception:
+            _async_created -= 1
+            raise
+        if _async_created == 1:
+            logging.info(f"Opened async database pool with up to {ASYNC_POOL_SIZE} connections.")
+    else:
+        waited = _async_idle.empty()
+        try:
+            connection = await asyncio.wait_for(_async_idle.get(), timeout=POOL_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            _async_pool_metrics["timeouts"] += 1
+            logging.error(f"Timed out after {POOL_WAIT_TIMEOUT}s waiting for an async database connection.")
+            raise
+
+        # Replace connections the server has dropped while they sat idle
+        if not await connection.is_connected():
+            await connection.reconnect()
+
+    wait_seconds = time.monotonic() - start
+    _async_pool_metrics["checkouts"] += 1
+    _async_pool_metrics["in_use"] += 1
+    _async_pool_metrics["peak_in_use"] = max(_async_pool_metrics["peak_in_use"], _async_pool_metrics["in_use"])
+    if waited:
+        _async_pool_metrics["waits"] += 1
+    _async_pool_metrics["total_wait_seconds"] += wait_seconds
+    _async_pool_metrics["max_wait_seconds"] = max(_async_pool_metrics["max_wait_seconds"], wait_seconds)
+    return connection
+
+# Function to hand a connection back to the async pool
+def _async_release(connection):
+    _async_pool_metrics["in_use"] -= 1
+    _async_idle.put_nowait(connection)
+
+# Async context manager yielding an async cursor inside a transaction, committing on success and rolling back on error
+@asynccontextmanager
+async def async_session(dictionary=False):
+    connection = await _async_checkout()
+    cursor = instrumentation.instrument_async_cursor(await connection.cursor(dictionary=dictionary))
+    try:
+        yield cursor
+        await connection.commit()
+    except Exception:
+        await connection.rollback()
+        raise
+    finally:
+        await cursor.close()
+        _async_release(connection)
+
+# Asynchronous function to close every idle async connection before the event loop shuts down
+async def close_async_pool():
+    global _async_idle, _async_created
+    if _async_idle is None:
+        return
+    while not _async_idle.empty():
+        connection = _async_idle.get_nowait()
+        try:
+            await connection.close()
+        except mysql.connector.Error as err:
+            logging.warning(f"Error closing async database connection: {err}")
+        _async_created -= 1
+    _async_idle = None
+
+# Function to report pool size and wait-time metrics for this process
+def pool_stats():
+    with _pool_lock:
+        stats = dict(_pool_metrics)
+    stats["pool_size"] = POOL_SIZE
+    stats["opened"] = _pool_opened
+    stats["total_wait_seconds"] = round(stats["total_wait_seconds"], 4)
+    stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 4)
+
+    if _async_pool_metrics["checkouts"]:
+        async_stats = dict(_async_pool_metrics)
+        async_stats["pool_size"] = ASYNC_POOL_SIZE
+        async_stats["opened"] = _async_created
+        async_stats["total_wait_seconds"] = round(async_stats["total_wait_seconds"], 4)
+        async_stats["max_wait_seconds"] = round(async_stats["max_wait_seconds"], 4)
+        stats["async"] = async_stats
+    return stats
+
+# The pool statistics are part of every job's metrics summary
+instrumentation.add_summary_source("pool", pool_stats)
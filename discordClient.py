@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import logging
+import requests
+from dotenv import load_dotenv
+import atomicFile
+import instrumentation
+
+# Load environment variables
+load_dotenv()
+
+DISCORD_API_BASE = os.getenv("DISCORD_API_BASE", "https://discord.com/api/v10")
+
+# Discord rejects messages longer than this many characters
+MESSAGE_LIMIT = 2000
+CODE_FENCE = "```"
+
+# Request settings
+MAX_ATTEMPTS = 5
+REQUEST_TIMEOUT = 15
+SERVER_ERROR_BACKOFF = 2
+
+# IDs of the messages posted for each key, so the next run edits them instead of posting again
+DISCORD_STATE_PATH = os.getenv("DISCORD_STATE_PATH", "cache/discord_messages.json")
+
+_session = None
+
+# Rate limit state learned from response headers: route -> bucket id, bucket id -> remaining/reset
+_route_buckets = {}
+_buckets = {}
+_global_reset_at = 0.0
+
+# Function to get the shared HTTP session for the Discord API, creating it on first use
+def get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update({
+            "Authorization": f"Bot {os.getenv('DISCORD_BOT_TOKEN')}",
+            "Content-Type": "application/json",
+        })
+    return _session
+
+# Function to wait until the route's bucket (and any global limit) allows another request
+def wait_for_bucket(route):
+    now = time.monotonic()
+    wait = max(_global_reset_at - now, 0)
+
+    bucket = _buckets.get(_route_buckets.get(route))
+    if bucket and bucket["remaining"] <= 0:
+        wait = max(wait, bucket["reset_at"] - now)
+
+    if wait > 0:
+        logging.info(f"Waiting {wait:.2f}s for the Discord rate limit on {route}.")
+        time.sleep(wait)
+
+# Function to record the rate limit headers of a response against its route's bucket
+def update_bucket(route, response):
+    bucket_id = response.headers.get("X-RateLimit-Bucket")
+    if not bucket_id:
+        return
+    _route_buckets[route] = bucket_id
+    try:
+        _buckets[bucket_id] = {
+            "remaining": int(response.headers.get("X-RateLimit-Remaining", 1)),
+            "reset_at": time.monotonic() + float(response.headers.get("X-RateLimit-Reset-After", 0)),
+        }
+    except ValueError:
+        _buckets.pop(bucket_id, None)
+
+# Function to get how long Discord asked us to back off after a 429
+def retry_after_seconds(response):
+    try:
+        return float(response.json().get("retry_after"))
+    except (ValueError, TypeError, AttributeError):
+        return float(response.headers.get("Retry-After", 1))
+
+# Function to send one Discord API request, respecting rate limits, returning the response or None
+def request(method, path, route, payload=None):
+    global _global_reset_at
+    url = f"{DISCORD_API_BASE}{path}"
+
+    for attempt in range(MAX_ATTEMPTS):
+        wait_for_bucket(route)
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, json=payload, timeout=REQUEST_TIMEOUT)
+            instrumentation.record_http("discord", route, response.status_code, time.perf_counter() - start)
+        except requests.RequestException as e:
+            instrumentation.record_http("discord", route, type(e).__name__, time.perf_counter() - start)
+            logging.error(f"Error calling Discord {route} (attempt {attempt + 1}): {e}")
+            time.sleep(SERVER_ERROR_BACKOFF * (attempt + 1))
+            continue
+
+        update_bucket(route, response)
+
+        if response.status_code == 429:
+            retry_after = retry_after_seconds(response)
+            if response.headers.get("X-RateLimit-Global"):
+                _global_reset_at = time.monotonic() + retry_after
+            logging.warning(f"Discord rate limited {route}, retrying in {retry_after:.2f}s.")
+            time.sleep(retry_after)
+            continue
+
+        if response.status_code >= 500:
+            logging.warning(f"Discord returned {response.status_code} for {route} (attempt {attempt + 1}).")
+            time.sleep(SERVER_ERROR_BACKOFF * (attempt + 1))
+            continue
+
+        return response
+
+    logging.error(f"Giving up on Discord {route} after {MAX_ATTEMPTS} attempts.")
+    return None
+
+# Function to split text into code-block messages under the Discord limit, only breaking between rows
+def split_code_block(text, limit=MESSAGE_LIMIT):
+    # Room for the opening and closing fences and their newlines
+    room = limit - len(CODE_FENCE) * 2 - 2
+    messages = []
+    current = ""
+
+    for line in text.splitlines(keepends=True):
+        if not line.endswith("\n"):
+            line += "\n"
+        # A single row that is too long on its own is cut rather than dropped
+        while len(line) > room:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(line[:room - 1] + "\n")
+            line = line[room - 1:]
+        if len(current) + len(line) > room:
+            messages.append(current)
+            current = ""
+        current += line
+
+    if current or not messages:
+        messages.append(current)
+    return [f"{CODE_FENCE}\n{message}{CODE_FENCE}" for message in messages]
+
+# Function to read the IDs of previously posted messages
+def load_state():
+    try:
+        with open(DISCORD_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Function to save the IDs of posted messages atomically
+def save_state(state):
+    try:
+        atomicFile.write_json(DISCORD_STATE_PATH, state)
+    except OSError as e:
+        logging.warning(f"Could not save the Discord message state: {e}")
+
+# Function to post a message to a channel, returning its ID or None
+def post_message(channel_id, content):
+    response = request("POST", f"/channels/{channel_id}/messages", f"POST /channels/{channel_id}/messages", {"content": content})
+    if response is not None and response.status_code == 200:
+        return response.json().get("id")
+    if response is not None:
+        logging.error(f"Failed to post Discord message: {response.status_code} - {response.text}")
+    return None
+
+# Function to edit a message in place, returning True on success and None if the message no longer exists
+def edit_message(channel_id, message_id, content):
+    response = request(
+        "PATCH", f"/channels/{channel_id}/messages/{message_id}",
+        f"PATCH /channels/{channel_id}/messages", {"content": content}
+    )
+    if response is not None and response.status_code == 200:
+        return True
+    if response is not None and response.status_code == 404:
+        return None
+    if response is not None:
+        logging.error(f"Failed to edit Discord message {message_id}: {response.status_code} - {response.text}")
+    return False
+
+# Function to delete a message that is no longer needed
+def delete_message(channel_id, message_id):
+    response = request("DELETE", f"/channels/{channel_id}/messages/{message_id}", f"DELETE /channels/{channel_id}/messages")
+    return response is not None and response.status_code in (204, 404)
+
+# Function to publish a set of messages under a key, editing the ones posted last time and posting or deleting the difference
+def publish(channel_id, key, messages):
+    state = load_state()
+    state_key = f"{key}:{channel_id}"
+    previous_ids = state.get(state_key, [])
+    message_ids = []
+    ok = True
+
+    for index, content in enumerate(messages):
+        message_id = previous_ids[index] if index < len(previous_ids) else None
+        if message_id:
+            edited = edit_message(channel_id, message_id, content)
+            if edited:
+                message_ids.append(message_id)
+                continue
+            if edited is False:
+                # Keep the old ID so the next run tries to edit it again
+                message_ids.append(message_id)
+                ok = False
+                continue
+            logging.info(f"Discord message {message_id} was deleted, posting a new one.")
+
+        new_id = post_message(channel_id, content)
+        if not new_id:
+            # Hold the page's place so the IDs after it still line up with their pages
+            ok = False
+        message_ids.append(new_id)
+
+    # Remove the pages left over from a longer previous version
+    for message_id in previous_ids[len(messages):]:
+        if message_id and not delete_message(channel_id, message_id):
+            message_ids.append(message_id)
+
+    state[state_key] = message_ids
+    save_state(state)
+    logging.info(f"Published {len(messages)} Discord messages for {key} ({len(previous_ids)} previously posted).")
+    return ok
@@ -1,9 +1,15 @@
-import aiohttp
 import asyncio
 import os
+import json
+import hashlib
 import logging
-from datetime import datetime
-from database import get_db_connection
+from collections import defaultdict
+from database import async_session, close_async_pool, pool_stats
+import apiUsage
+import apiBudget
+import tank01
+import jobLock
+import outbox
 import traceback
 
 logging.basicConfig(
@@ -12,132 +18,126 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-# Function to update API usage count
-def update_api_usage(api_calls, db, cursor):
-    current_month_year = datetime.now().strftime("%Y-%m")
-
-    # Check the current usage for the month
-    cursor.execute("SELECT request_count FROM api_usage WHERE month_year = %s", (current_month_year,))
-    result = cursor.fetchone()
-
-    if result:
-        new_count = result[0] + api_calls
-        cursor.execute("UPDATE api_usage SET request_count = %s, request_time = NOW() WHERE month_year = %s",
-                       (new_count, current_month_year))
-        logging.info(f"Updated API usage for month {current_month_year}: new count is {new_count}")
-    else:
-        cursor.execute("INSERT INTO api_usage (request_count, request_time, month_year) VALUES (%s, NOW(), %s)",
-                       (api_calls, current_month_year))
-        logging.info(f"Inserted new API usage record for month {current_month_year}: count is {api_calls}")
-
-# Function to fetch injured players from the API
-async def fetch_injury_status(player_ids, db, cursor):
-    url = "https://tank01-nfl-live-in-game-real-time-statistics-nfl.p.rapidapi.com/getNFLPlayerList"
-    headers = {
-        "x-rapidapi-key": os.getenv("RAPIDAPI_KEY"),
-        "x-rapidapi-host": os.getenv("RAPIDAPI_HOST")
-    }
-
-    params = {"playerIDs": ",".join(map(str, player_ids))}
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    logging.info("Successfully fetched player injury status from API")
-                    response_data = await response.json()
-                    update_api_usage(1, db, cursor)  # Update API usage count by 1 for this API call
-                    return response_data.get('body', [])
-                else:
-                    error_text = await response.text()
-                    logging.error(f"Failed to fetch player list: {response.status} - {error_text}")
-                    return None
-        except aiohttp.ClientError as e:
-            logging.error(f"Error fetching player injury status from API: {e}")
-            return None
-
-# Function to update the injury status in the database and trigger a webhook notification
-async def update_injury_status(players, db, cursor):
-    async with aiohttp.ClientSession() as session:
-        for player in players:
-            player_id = player.get("playerID")
-            injury_status = player["injury"].get("designation", "Unknown")
-
-            if injury_status in ["Out", "Injured Reserve"]:
-                logging.info(f"Player {player_id} is listed as {injury_status}, removing pick.")
-                try:
-                    # Remove the player's pick if status is "Out" or "Injured Reserve"
-                    cursor.execute("""
-                        DELETE FROM picks
-                        WHERE player_id = %s AND is_successful = 0
-                    """, (player_id,))
-                    logging.info(f"Removed pick for player_id {player_id} due to status: {injury_status}")
-
-                    # Fetch the user IDs who picked the injured player
-                    cursor.execute("""
-                        SELECT user_id FROM picks WHERE player_id = %s AND is_successful = 0
-                    """, (player_id,))
-                    tagged_users = [row['user_id'] for row in cursor.fetchall()]
-
-                    # Trigger the webhook to notify users to pick a new player
-                    if tagged_users:
-                        await send_injury_notification(session, player.get("longName"), injury_status, tagged_users)
-
-                except Exception as e:
-                    logging.error(f"Failed to remove pick for player_id {player_id}: {e}")
-                    logging.error(traceback.format_exc())
-
-# Function to send injury notification via webhook for players "Out" or "Injured Reserve"
-async def send_injury_notification(session, player_name, injury_status, tagged_users):
-    url = "http://localhost:3000/webhook/player-injury"
-    headers = {
-        "Authorization": os.getenv("WEBHOOK_SECRET"),
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "playerName": player_name,
-        "injuryStatus": injury_status,
-        "taggedUsers": tagged_users
-    }
-
-    try:
-        async with session.post(url, json=payload, headers=headers) as response:
-            if response.status == 200:
-                logging.info(f"Successfully sent injury notification for player: {player_name}")
-            else:
-                error_text = await response.text()
-                logging.error(f"Failed to send injury notification: {response.status} - {error_text}")
-    except aiohttp.ClientError as e:
-        logging.error(f"Error sending injury notification: {e}")
+# Normal gap between scheduled injury checks, stretched by the API budget when needed
+INJURY_CHECK_INTERVAL_MINUTES = int(os.getenv("INJURY_CHECK_INTERVAL_MINUTES", "15"))
+
+# Number of player IDs per injury status request, and how many of those requests run at once
+INJURY_FETCH_CHUNK_SIZE = int(os.getenv("INJURY_FETCH_CHUNK_SIZE", "50"))
+INJURY_FETCH_CONCURRENCY = int(os.getenv("INJURY_FETCH_CONCURRENCY", "4"))
+
+# Injury designations that remove a player's open picks
+REMOVAL_DESIGNATIONS = ("Out", "Injured Reserve")
+
+# Function to fetch injured players from the API, in chunks of player IDs fetched concurrently
+async def fetch_injury_status(player_ids):
+    player_ids = [str(player_id) for player_id in player_ids]
+    chunks = [player_ids[start:start + INJURY_FETCH_CHUNK_SIZE] for start in range(0, len(player_ids), INJURY_FETCH_CHUNK_SIZE)]
+    requests_to_send = [("getNFLPlayerList", {"playerIDs": ",".join(chunk)}) for chunk in chunks]
+
+    # Injury designations change minute to minute on game day, so never serve them from the cache
+    results = await tank01.fetch_many(requests_to_send, limit=INJURY_FETCH_CONCURRENCY, use_cache=False)
+
+    players = []
+    failed = 0
+    for body in results:
+        if body is None:
+            failed += 1
+        elif isinstance(body, dict):
+            players.append(body)
+        else:
+            players.extend(body)
+
+    if failed:
+        logging.warning(f"{failed} of {len(chunks)} injury status requests failed, those players will be checked next run.")
+    logging.info(f"Fetched injury status for {len(players)} of {len(player_ids)} players in {len(chunks)} requests.")
+    return players if failed < len(chunks) else None
+
+# Function to remove the open picks of every newly Out/IR player in one pass and queue the notifications.
+# Costs one SELECT, one DELETE and one outbox insert however many players are on the report.
+async def update_injury_status(players, cursor):
+    injured = {}
+    for player in players:
+        injury_status = (player.get("injury") or {}).get("designation", "Unknown")
+        if injury_status in REMOVAL_DESIGNATIONS:
+            injured[str(player.get("playerID"))] = (player.get("longName"), injury_status)
+
+    if not injured:
+        logging.info("No players listed as Out or Injured Reserve.")
+        return 0
+
+    # Capture and lock every affected (user, pick) pair before anything is removed, so a scoring run cannot mark one successful in between
+    placeholders = ", ".join(["%s"] * len(injured))
+    await cursor.execute(f"""
+        SELECT id, user_id, player_id FROM picks
+        WHERE player_id IN ({placeholders}) AND is_successful = 0
+        FOR UPDATE
+    """, list(injured))
+    affected = await cursor.fetchall()
+
+    if not affected:
+        logging.info(f"{len(injured)} players are listed as Out or Injured Reserve, but none have open picks.")
+        return 0
+
+    # Remove all of their picks in one statement, never one that has already scored
+    pick_ids = [row['id'] for row in affected]
+    await cursor.execute(f"""
+        DELETE FROM picks WHERE id IN ({", ".join(["%s"] * len(pick_ids))}) AND is_successful = 0
+    """, pick_ids)
+    logging.info(f"Removed {cursor.rowcount} picks of {len(injured)} players listed as Out or Injured Reserve.")
+
+    # Group the affected users by player so each player gets one notification
+    users_by_player = defaultdict(list)
+    for row in affected:
+        users_by_player[str(row['player_id'])].append(row['user_id'])
+
+    # Queue one notification per player in the same transaction, keyed by the picks it removed
+    notifications = []
+    for player_id, tagged_users in users_by_player.items():
+        player_name, injury_status = injured[player_id]
+        logging.info(f"Player {player_name} ({player_id}) is listed as {injury_status}, removed {len(tagged_users)} picks.")
+        removed_ids = sorted(row['id'] for row in affected if str(row['player_id']) == player_id)
+        dedupe_key = f"injury:{player_id}:{hashlib.sha1(json.dumps(removed_ids).encode('utf-8')).hexdigest()[:16]}"
+        payload = {"playerName": player_name, "injuryStatus": injury_status, "taggedUsers": tagged_users}
+        notifications.append((dedupe_key, "injury", payload))
+    return await outbox.async_enqueue(cursor, notifications)
 
 # Main execution for injury check
 async def main():
     logging.info("Starting player injury status update.")
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
+    if not await asyncio.to_thread(apiBudget.should_run, "injuryCheck", INJURY_CHECK_INTERVAL_MINUTES):
+        return
+
     try:
-        # Fetch the list of player_ids from the picks table where picks are active
-        cursor.execute("SELECT DISTINCT player_id FROM picks WHERE is_successful = 0 AND Is_injured = 0")
-        player_ids = [row['player_id'] for row in cursor.fetchall()]
+        await outbox.async_ensure_outbox_table()
+
+        async with async_session(dictionary=True) as cursor:
+            # Fetch the list of player_ids from the picks table where picks are active
+            await cursor.execute("SELECT DISTINCT player_id FROM picks WHERE is_successful = 0 AND Is_injured = 0")
+            player_ids = [row['player_id'] for row in await cursor.fetchall()]
 
         if not player_ids:
             logging.info("No players to check for injury updates.")
             return
 
-        # Fetch the injury status for only the relevant players
-        players = await fetch_injury_status(player_ids, db, cursor)
+        # Fetch the injury status for only the relevant players, outside of any transaction
+        players = await fetch_injury_status(player_ids)
         if players:
-            await update_injury_status(players, db, cursor)
+            async with async_session(dictionary=True) as cursor:
+                await update_injury_status(players, cursor)
 
-        db.commit()
+        # Notify users to pick a new player once the removals are committed
+        await outbox.drain_outbox()
         logging.info("Player injury status update completed successfully.")
     except Exception as e:
         logging.error(f"An error occurred during the injury update: {e}")
         logging.error(traceback.format_exc())
     finally:
-        cursor.close()
-        db.close()
-        logging.info("Database connection closed.")
+        await tank01.close_session()
+        await apiUsage.async_flush_api_usage()
+        await close_async_pool()
+        logging.info(f"Database pool stats: {pool_stats()}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    with jobLock.single_flight("injuryCheck") as should_run:
+        if should_run:
+            asyncio.run(main())
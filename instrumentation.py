@@ -0,0 +1,284 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import pstats
+import logging
+import cProfile
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+import atomicFile
+
+# Load environment variables
+load_dotenv()
+
+# Name of the job being measured, the same one API usage is attributed to
+JOB_NAME = os.path.splitext(os.path.basename(sys.argv[0] or "interactive"))[0]
+
+# Where the per-job summary goes when the job ends: "json" appends a line to <job>.jsonl,
+# "prometheus" rewrites a node_exporter textfile <job>.prom, "off" disables both (comma separated for several)
+METRICS_FORMATS = {fmt.strip() for fmt in os.getenv("METRICS_FORMAT", "json").split(",") if fmt.strip()}
+METRICS_DIR = os.getenv("METRICS_DIR", "logs/metrics")
+
+# Opt-in cProfile dump: "all" or a comma separated list of job names
+PROFILE_JOBS = {job.strip() for job in os.getenv("PROFILE_JOBS", "").split(",") if job.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+
+# Statements in the summary log line, and the longest fingerprint kept
+TOP_STATEMENTS = 5
+MAX_FINGERPRINT_LENGTH = 300
+FINGERPRINT_CACHE_SIZE = 512
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+VALUES_LIST = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+NUMERIC_PATH_PART = re.compile(r"/\d+(?=/|$)")
+
+_lock = threading.Lock()
+_started_at = datetime.now()
+_start = time.perf_counter()
+
+# fingerprint -> {"count", "seconds", "max_seconds", "rows"}
+_sql_stats = {}
+# (service, endpoint, status) -> {"count", "seconds", "max_seconds"}
+_http_stats = {}
+# Extra sections for the summary, such as the database pool statistics
+_summary_sources = {}
+_fingerprints = {}
+
+# Function to reduce a SQL statement to its shape: literals become ?, IN lists and multi-row VALUES collapse
+def sql_fingerprint(statement):
+    if isinstance(statement, (bytes, bytearray)):
+        statement = statement.decode("utf-8", "replace")
+    cached = _fingerprints.get(statement)
+    if cached is not None:
+        return cached
+
+    fingerprint = STRING_LITERAL.sub("?", statement)
+    fingerprint = NUMBER_LITERAL.sub("?", fingerprint)
+    fingerprint = fingerprint.replace("%s", "?")
+    fingerprint = WHITESPACE.sub(" ", fingerprint).strip()
+    fingerprint = PLACEHOLDER_LIST.sub("(...)", fingerprint)
+    fingerprint = VALUES_LIST.sub(r"\1", fingerprint)
+    fingerprint = fingerprint[:MAX_FINGERPRINT_LENGTH]
+
+    # Only short templates are cached, batched statements with inlined values are unique every time
+    if len(statement) <= 4 * MAX_FINGERPRINT_LENGTH and len(_fingerprints) < FINGERPRINT_CACHE_SIZE:
+        _fingerprints[statement] = fingerprint
+    return fingerprint
+
+# Function to add one timing to a stats table
+def _add(table, key, seconds, rows=None):
+    with _lock:
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+            if rows is not None:
+                entry["rows"] = 0
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        if rows is not None and rows > 0:
+            entry["rows"] += rows
+
+# Function to add time spent reading a statement's rows to its fingerprint, without counting another round trip
+def record_fetch(fingerprint, seconds, rows):
+    with _lock:
+        entry = _sql_stats.get(fingerprint)
+        if entry is not None:
+            entry["seconds"] += seconds
+            entry["rows"] += rows
+
+# Function to record one HTTP request by service, endpoint and status (or exception name)
+def record_http(service, endpoint, status, seconds):
+    _add(_http_stats, (service, NUMERIC_PATH_PART.sub("/{id}", str(endpoint)), str(status)), seconds)
+
+# Function to time every statement run through a cursor, replacing its execute and fetch methods on the instance.
+# executemany() goes through execute(), so each round trip it makes is counted once.
+def instrument_cursor(cursor):
+    execute = cursor.execute
+    fetchone, fetchall, fetchmany = cursor.fetchone, cursor.fetchall, cursor.fetchmany
+    last = {"fingerprint": None}
+
+    def timed_execute(operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return execute(operation, params, *args, **kwargs)
+        finally:
+            last["fingerprint"] = sql_fingerprint(operation)
+            _add(_sql_stats, last["fingerprint"], time.perf_counter() - start, max(cursor.rowcount or 0, 0))
+
+    def timed_fetch(fetch):
+        def fetch_rows(*args, **kwargs):
+            start = time.perf_counter()
+            result = fetch(*args, **kwargs)
+            rows = len(result) if isinstance(result, list) else int(result is not None)
+            record_fetch(last["fingerprint"], time.perf_counter() - start, rows)
+            return result
+        return fetch_rows
+
+    cursor.execute = timed_execute
+    cursor.fetchone = timed_fetch(fetchone)
+    cursor.fetchall = timed_fetch(fetchall)
+    cursor.fetchmany = timed_fetch(fetchmany)
+    return cursor
+
+# Asynchronous version of instrument_cursor() for cursors of the async pool
+def instrument_async_cursor(cursor):
+    execute = cursor.execute
+    fetchone, fetchall, fetchmany = cursor.fetchone, cursor.fetchall, cursor.fetchmany
+    last = {"fingerprint": None}
+
+    async def timed_execute(operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await execute(operation, params, *args, **kwargs)
+        finally:
+            last["fingerprint"] = sql_fingerprint(operation)
+            _add(_sql_stats, last["fingerprint"], time.perf_counter() - start, max(cursor.rowcount or 0, 0))
+
+    def timed_fetch(fetch):
+        async def fetch_rows(*args, **kwargs):
+            start = time.perf_counter()
+            result = await fetch(*args, **kwargs)
+            rows = len(result) if isinstance(result, list) else int(result is not None)
+            record_fetch(last["fingerprint"], time.perf_counter() - start, rows)
+            return result
+        return fetch_rows
+
+    cursor.execute = timed_execute
+    cursor.fetchone = timed_fetch(fetchone)
+    cursor.fetchall = timed_fetch(fetchall)
+    cursor.fetchmany = timed_fetch(fetchmany)
+    return cursor
+
+# Function to add a named section to the summary, filled by calling `source` when the job ends
+def add_summary_source(name, source):
+    _summary_sources[name] = source
+
+# Function to build the summary of everything measured in this process
+def build_summary():
+    with _lock:
+        sql = sorted(_sql_stats.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        http = sorted(_http_stats.items(), key=lambda item: item[1]["seconds"], reverse=True)
+
+    summary = {
+        "job": JOB_NAME,
+        "pid": os.getpid(),
+        "started_at": _started_at.isoformat(timespec="seconds"),
+        "wall_seconds": round(time.perf_counter() - _start, 4),
+        "sql_round_trips": sum(entry["count"] for _, entry in sql),
+        "sql_seconds": round(sum(entry["seconds"] for _, entry in sql), 4),
+        "sql": [
+            {"statement": fingerprint, "count": entry["count"], "seconds": round(entry["seconds"], 4),
+             "max_seconds": round(entry["max_seconds"], 4), "rows": entry["rows"]}
+            for fingerprint, entry in sql
+        ],
+        "http_requests": sum(entry["count"] for _, entry in http),
+        "http": [
+            {"service": service, "endpoint": endpoint, "status": status, "count": entry["count"],
+             "seconds": round(entry["seconds"], 4), "max_seconds": round(entry["max_seconds"], 4)}
+            for (service, endpoint, status), entry in http
+        ],
+    }
+    for name, source in _summary_sources.items():
+        try:
+            summary[name] = source()
+        except Exception as e:
+            summary[name] = {"error": repr(e)}
+    return summary
+
+# Function to escape a Prometheus label value
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+# Function to render the summary in the Prometheus text exposition format
+def prometheus_text(summary):
+    job = _label(summary["job"])
+    lines = [
+        "# HELP td_job_wall_seconds Wall time of the last run of the job.",
+        "# TYPE td_job_wall_seconds gauge",
+        f'td_job_wall_seconds{{job="{job}"}} {summary["wall_seconds"]}',
+        "# HELP td_job_last_run_timestamp_seconds When the last run of the job ended.",
+        "# TYPE td_job_last_run_timestamp_seconds gauge",
+        f'td_job_last_run_timestamp_seconds{{job="{job}"}} {time.time():.0f}',
+        "# HELP td_sql_round_trips Statements sent to MySQL in the last run, by statement fingerprint.",
+        "# TYPE td_sql_round_trips gauge",
+    ]
+    lines += [f'td_sql_round_trips{{job="{job}",statement="{_label(entry["statement"])}"}} {entry["count"]}' for entry in summary["sql"]]
+    lines += [
+        "# HELP td_sql_seconds Time spent in MySQL in the last run, by statement fingerprint.",
+        "# TYPE td_sql_seconds gauge",
+    ]
+    lines += [f'td_sql_seconds{{job="{job}",statement="{_label(entry["statement"])}"}} {entry["seconds"]}' for entry in summary["sql"]]
+    lines += [
+        "# HELP td_http_requests HTTP requests made in the last run, by service, endpoint and status.",
+        "# TYPE td_http_requests gauge",
+    ]
+    http_labels = [
+        (f'job="{job}",service="{_label(entry["service"])}",endpoint="{_label(entry["endpoint"])}",status="{_label(entry["status"])}"', entry)
+        for entry in summary["http"]
+    ]
+    lines += [f"td_http_requests{{{labels}}} {entry['count']}" for labels, entry in http_labels]
+    lines += [
+        "# HELP td_http_seconds Time spent waiting on HTTP responses in the last run.",
+        "# TYPE td_http_seconds gauge",
+    ]
+    lines += [f"td_http_seconds{{{labels}}} {entry['seconds']}" for labels, entry in http_labels]
+    return "\n".join(lines) + "\n"
+
+# Function to write the job summary in the configured formats and log the slowest statements
+def write_summary():
+    if "off" in METRICS_FORMATS:
+        return
+    summary = build_summary()
+    if not summary["sql"] and not summary["http"]:
+        return
+
+    try:
+        if "json" in METRICS_FORMATS:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(os.path.join(METRICS_DIR, f"{JOB_NAME}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary) + "\n")
+        if "prometheus" in METRICS_FORMATS:
+            atomicFile.write_text(os.path.join(METRICS_DIR, f"{JOB_NAME}.prom"), prometheus_text(summary))
+    except OSError as e:
+        logging.warning(f"Could not write the metrics summary of {JOB_NAME}: {e}")
+
+    top = ", ".join(f"{entry['count']}x {entry['seconds']:.3f}s {entry['statement'][:80]}" for entry in summary["sql"][:TOP_STATEMENTS])
+    logging.info(
+        f"{JOB_NAME} metrics: {summary['wall_seconds']:.2f}s wall, {summary['sql_round_trips']} SQL round trips "
+        f"({summary['sql_seconds']:.3f}s), {summary['http_requests']} HTTP requests. Slowest statements: {top or '-'}"
+    )
+
+_profiler = None
+
+# Function to start profiling the job if it was opted in through PROFILE_JOBS
+def start_profiler():
+    global _profiler
+    if _profiler is None and ("all" in PROFILE_JOBS or JOB_NAME in PROFILE_JOBS):
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+# Function to stop the profiler and dump its stats for snakeviz/pstats
+def dump_profile():
+    if _profiler is None:
+        return
+    _profiler.disable()
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{JOB_NAME}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.prof")
+        pstats.Stats(_profiler).dump_stats(path)
+        logging.info(f"Wrote the profile of {JOB_NAME} to {path}")
+    except OSError as e:
+        logging.warning(f"Could not write the profile of {JOB_NAME}: {e}")
+
+# Profiling starts as soon as the first module imports this one, the summary and profile are written at exit
+start_profiler()
+atexit.register(write_summary)
+atexit.register(dump_profile)
@@ -0,0 +1,237 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+import mysql.connector
+from dotenv import load_dotenv
+from database import session, get_db_connection
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only the MySQL backend is available
+    fcntl = None
+
+# Load environment variables
+load_dotenv()
+
+# "mysql" uses GET_LOCK on a dedicated pooled connection, "file" uses flock on a lock file next to the scripts
+LOCK_BACKEND = os.getenv("JOB_LOCK_BACKEND", "mysql")
+LOCK_DIR = os.getenv("JOB_LOCK_DIR", "locks")
+LOCK_PREFIX = "td_showdown:"
+
+# How long a second invocation waits for the first to finish in "wait" mode
+LOCK_WAIT_TIMEOUT = int(os.getenv("JOB_LOCK_WAIT_TIMEOUT", "900"))
+FILE_LOCK_POLL_SECONDS = 0.5
+
+# What a second invocation does while the job is already running:
+# "skip" exits straight away, "wait" waits for the first run and reuses its results if it finished meanwhile
+DEFAULT_MODES = {
+    "scheduleUpdate": "wait",
+    "playerUpdate": "wait",
+    "getPlayerInfo": "wait",
+    "injuryCheck": "wait",
+    "leaderboard": "wait",
+    "standings": "wait",
+    "create_game_schedules": "wait",
+    # scorepicks and liveScoring run the same scoring pipeline, so they share one lock
+    "scoring": "skip",
+    "scheduler": "skip",
+    "outbox": "skip",
+}
+
+CREATE_JOB_RUNS_SQL = """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        job VARCHAR(64) NOT NULL PRIMARY KEY,
+        runs INT NOT NULL DEFAULT 0,
+        skips INT NOT NULL DEFAULT 0,
+        waits INT NOT NULL DEFAULT 0,
+        reuses INT NOT NULL DEFAULT 0,
+        total_wait_seconds DOUBLE NOT NULL DEFAULT 0,
+        last_started_at DATETIME NULL,
+        last_finished_at DATETIME NULL
+    )
+"""
+
+_job_runs_ready = False
+
+# Handles of the locks this process holds, by job
+_held_locks = {}
+
+# Function to record a lock outcome for a job; bookkeeping failures never stop the job
+def record_outcome(job, outcome, wait_seconds=0.0, started_at=None, finished_at=None):
+    global _job_runs_ready
+    try:
+        with session() as cursor:
+            if not _job_runs_ready:
+                cursor.execute(CREATE_JOB_RUNS_SQL)
+                _job_runs_ready = True
+            cursor.execute("""
+                INSERT INTO job_runs (job, runs, skips, waits, reuses, total_wait_seconds, last_started_at, last_finished_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    runs = runs + VALUES(runs),
+                    skips = skips + VALUES(skips),
+                    waits = waits + VALUES(waits),
+                    reuses = reuses + VALUES(reuses),
+                    total_wait_seconds = total_wait_seconds + VALUES(total_wait_seconds),
+                    last_started_at = COALESCE(VALUES(last_started_at), last_started_at),
+                    last_finished_at = COALESCE(VALUES(last_finished_at), last_finished_at)
+            """, (
+                job,
+                1 if outcome == "run" else 0,
+                1 if outcome == "skip" else 0,
+                1 if wait_seconds > 0 else 0,
+                1 if outcome == "reuse" else 0,
+                round(wait_seconds, 3),
+                started_at,
+                finished_at,
+            ))
+    except Exception as e:
+        logging.warning(f"Could not record lock statistics for {job}: {e}")
+
+# Function to get when the job last finished a run
+def last_finished_at(job):
+    try:
+        with session() as cursor:
+            cursor.execute("SELECT last_finished_at FROM job_runs WHERE job = %s", (job,))
+            result = cursor.fetchone()
+        return result[0] if result else None
+    except Exception as e:
+        logging.warning(f"Could not read the last run of {job}: {e}")
+        return None
+
+# Function to take a MySQL named lock, returning its handle or None if it was not acquired in time.
+# The lock lives as long as the connection holding it, so long-running jobs call keep_lock() to ping and re-check it.
+def acquire_mysql_lock(job, timeout):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_PREFIX + job, timeout))
+    acquired = cursor.fetchone()[0] == 1
+    if not acquired:
+        cursor.close()
+        connection.close()
+        return None
+
+    def check():
+        try:
+            cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (LOCK_PREFIX + job,))
+            return cursor.fetchone()[0] == 1
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not check the {job} lock: {e}")
+            return False
+
+    def release():
+        try:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_PREFIX + job,))
+            cursor.fetchone()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not release the {job} lock, its connection is gone: {e}")
+        finally:
+            try:
+                cursor.close()
+                connection.close()
+            except mysql.connector.Error:
+                pass
+    return {"release": release, "check": check}
+
+# Function to take an exclusive lock file, returning its handle or None if it was not acquired in time
+def acquire_file_lock(job, timeout):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    lock_file = open(os.path.join(LOCK_DIR, f"{job}.lock"), "w")
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                lock_file.close()
+                return None
+            time.sleep(FILE_LOCK_POLL_SECONDS)
+
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+
+    def release():
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+    # The lock is held for as long as this process keeps the file open
+    return {"release": release, "check": lambda: True}
+
+# Function to take the job's lock with the configured backend
+def acquire_lock(job, timeout):
+    if LOCK_BACKEND == "file" and fcntl is not None:
+        return acquire_file_lock(job, timeout)
+    return acquire_mysql_lock(job, timeout)
+
+# Function for long-running jobs to call regularly while they hold their lock.
+# Keeps the lock's connection from idling out, and takes the lock again if the server dropped it.
+# Returns False when another run has taken the lock meanwhile, and the caller should stop.
+def keep_lock(job):
+    handle = _held_locks.get(job)
+    if handle is None or handle["check"]():
+        return True
+
+    logging.warning(f"Lost the {job} lock, the connection holding it was dropped. Taking it again.")
+    try:
+        new_handle = acquire_lock(job, 0)
+    except Exception as e:
+        # Same as single_flight: without the lock service the job carries on
+        logging.warning(f"Could not take the {job} lock again, running without it: {e}")
+        return True
+    if new_handle is None:
+        logging.error(f"Another run of {job} took the lock while it was lost.")
+        return False
+
+    handle["release"]()
+    _held_locks[job] = new_handle
+    return True
+
+# Context manager making a job single-flight. Yields True when this process should do the work,
+# False when another run of the job is in progress ("skip") or has just produced fresh results ("wait").
+@contextmanager
+def single_flight(job, mode=None):
+    mode = mode or DEFAULT_MODES.get(job, "skip")
+    requested_at = datetime.now().replace(microsecond=0)
+    start = time.monotonic()
+
+    waited = False
+    try:
+        handle = acquire_lock(job, 0)
+        if handle is None and mode == "wait":
+            logging.info(f"{job} is already running, waiting up to {LOCK_WAIT_TIMEOUT}s for it to finish.")
+            waited = True
+            handle = acquire_lock(job, LOCK_WAIT_TIMEOUT)
+    except Exception as e:
+        # Without the lock service the job runs as it did before locking existed
+        logging.warning(f"Could not take the {job} lock, running without it: {e}")
+        yield True
+        return
+
+    wait_seconds = time.monotonic() - start if waited else 0.0
+
+    if handle is None:
+        logging.info(f"{job} is already running. Skipping this run.")
+        record_outcome(job, "skip", wait_seconds)
+        yield False
+        return
+
+    _held_locks[job] = handle
+    try:
+        # A run that finished while we waited has already done this work
+        finished = last_finished_at(job) if waited else None
+        if finished is not None and finished >= requested_at:
+            logging.info(f"{job} finished at {finished} while this run was waiting. Reusing its results.")
+            record_outcome(job, "reuse", wait_seconds)
+            yield False
+            return
+
+        started_at = datetime.now().replace(microsecond=0)
+        try:
+            yield True
+        finally:
+            record_outcome(job, "run", wait_seconds, started_at=started_at, finished_at=datetime.now().replace(microsecond=0))
+    finally:
+        # keep_lock() may have replaced the handle with a new one
+        _held_locks.pop(job)["release"]()
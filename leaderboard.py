@@ -1,34 +1,25 @@
 import os
+import json
 import logging
-import requests
 from dotenv import load_dotenv
-from database import get_db_connection  # Import the database connection function
-import time
+import atomicFile
+import standings
+import discordClient
+import jobLock
 
 # Load environment variables
 load_dotenv()
 
-# Discord API helper function with retries
+# Last rendered leaderboard, keyed by the standings version it was rendered from
+LEADERBOARD_RENDER_CACHE = os.getenv("LEADERBOARD_RENDER_CACHE", "cache/leaderboard_render.json")
+
+# Function to publish the leaderboard, editing the previously posted messages in place when they exist
 def send_discord_message(DISCORD_CHANNEL_ID, message):
-    url = f'https://discord.com/api/channels/{DISCORD_CHANNEL_ID}/messages'
-    headers = {
-        'Authorization': f'Bot {os.getenv("DISCORD_BOT_TOKEN")}',
-        'Content-Type': 'application/json'
-    }
-    data = {
-        'content': message
-    }
-
-    for attempt in range(3):  # Retry up to 3 times
-        response = requests.post(url, headers=headers, json=data)
-        if response.status_code == 200:
-            logging.info("Message sent successfully!")
-            return True
-        else:
-            logging.error(f"Attempt {attempt + 1} failed to send message: {response.status_code}")
-            time.sleep(2)  # Wait for 2 seconds before retrying
-
-    logging.error("Failed to send message after 3 attempts.")
+    # Long tables are split across several messages at row boundaries
+    messages = discordClient.split_code_block(message)
+    if discordClient.publish(DISCORD_CHANNEL_ID, "leaderboard", messages):
+        logging.info(f"Leaderboard published in {len(messages)} message(s).")
+        return True
     return False
 
 # Function to build a table format similar to pick history
@@ -45,49 +36,31 @@ def format_leaderboard_table(rows, header):
 
     return table
 
-# Function to fetch the leaderboard data
+# Function to fetch the leaderboard data from the precomputed standings
 def fetch_leaderboard_data():
     try:
-        db = get_db_connection()  # Use the get_db_connection function from database.py
-        cursor = db.cursor(dictionary=True)
-
-        # Fetch the weekly leaderboard
-        cursor.execute("""
-            SELECT p.week, pl.player_name, p.is_successful, COUNT(p.is_successful) as points
-            FROM picks p
-            JOIN players pl ON p.player_id = pl.player_id
-            WHERE p.is_successful = 1
-            GROUP BY p.user_id, p.week, pl.player_name, p.is_successful
-            ORDER BY p.week;
-        """)
-        weekly_leaderboard = cursor.fetchall()
-
-        # Fetch the overall leaderboard
-        cursor.execute("""
-            SELECT u.username, l.total_points
-            FROM users u
-            JOIN leaderboard l ON u.user_id = l.user_id
-            ORDER BY l.total_points DESC;
-        """)
-        overall_leaderboard = cursor.fetchall()
-
-        cursor.close()
-        db.close()
-
-        return weekly_leaderboard, overall_leaderboard
-
+        return standings.load_standings()
     except Exception as err:
         logging.error(f"Database connection failed: {err}")
         return None, None
 
-# Main function to generate and send the leaderboard
-def generate_and_send_leaderboard():
-    weekly_leaderboard, overall_leaderboard = fetch_leaderboard_data()
+# Function to read the last rendered leaderboard and whether it was posted
+def load_render_cache():
+    try:
+        with open(LEADERBOARD_RENDER_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    if weekly_leaderboard is None or overall_leaderboard is None:
-        logging.error("No leaderboard data to display.")
-        return
+# Function to save the rendered leaderboard atomically
+def save_render_cache(state):
+    try:
+        atomicFile.write_json(LEADERBOARD_RENDER_CACHE, state)
+    except OSError as e:
+        logging.warning(f"Could not save the leaderboard render cache: {e}")
 
+# Function to render the weekly and overall leaderboards into one Discord message
+def render_leaderboard(weekly_leaderboard, overall_leaderboard):
     # Format weekly leaderboard
     weekly_header = 'Wk Player                     TD P\n'
     formatted_weekly = format_leaderboard_table(weekly_leaderboard, weekly_header)
@@ -100,11 +73,43 @@ def generate_and_send_leaderboard():
         total_points = str(row['total_points']).rjust(5)
         overall_table += f'{idx}. {username} {total_points} pts\n'
 
-    # Combine the two tables
-    full_message = f"```\n{formatted_weekly}\n{overall_table}\n```"
+    # Combine the two tables, the Discord client wraps them in code blocks
+    return f"{formatted_weekly}\n{overall_table}"
+
+# Main function to generate and send the leaderboard, skipped when the standings have not changed since the last post
+def generate_and_send_leaderboard():
+    try:
+        version = standings.current_version()
+        if version == 0:
+            logging.info("Standings have never been built. Rebuilding them from the pick history.")
+            standings.rebuild()
+            version = standings.current_version()
+    except Exception as err:
+        logging.error(f"Database connection failed: {err}")
+        return
+
+    render_cache = load_render_cache()
+    if render_cache.get("version") == version and render_cache.get("posted"):
+        logging.info(f"Standings unchanged since version {version} was posted. Skipping.")
+        return
+
+    if render_cache.get("version") == version and render_cache.get("message"):
+        # Rendered before but the post failed, so only the post needs retrying
+        full_message = render_cache["message"]
+    else:
+        weekly_leaderboard, overall_leaderboard = fetch_leaderboard_data()
+
+        if weekly_leaderboard is None or overall_leaderboard is None:
+            logging.error("No leaderboard data to display.")
+            return
+
+        full_message = render_leaderboard(weekly_leaderboard, overall_leaderboard)
+        save_render_cache({"version": version, "message": full_message, "posted": False})
 
     # Send the message to the Discord channel
-    if not send_discord_message(os.getenv("DISCORD_CHANNEL_ID"), full_message):
+    if send_discord_message(os.getenv("DISCORD_CHANNEL_ID"), full_message):
+        save_render_cache({"version": version, "message": full_message, "posted": True})
+    else:
         logging.error("Failed to send leaderboard message.")
 
 if __name__ == "__main__":
@@ -115,5 +120,7 @@ if __name__ == "__main__":
     )
 
     logging.info("Generating and sending leaderboard...")
-    generate_and_send_leaderboard()
+    with jobLock.single_flight("leaderboard") as should_run:
+        if should_run:
+            generate_and_send_leaderboard()
     logging.info("Leaderboard process completed.")
\ No newline at end of file
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import signal
+import logging
+import traceback
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import session, close_async_pool, pool_stats
+import scorepicks
+import tank01
+import outbox
+import jobLock
+import apiBudget
+import seasonCalendar
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Tank01 game status codes
+STATUS_SCHEDULED = 0
+STATUS_LIVE = 1
+STATUS_FINAL = 2
+STATUS_POSTPONED = 3
+STATUS_SUSPENDED = 4
+FINISHED_STATUS_CODES = (STATUS_FINAL, STATUS_POSTPONED)
+
+# Poll intervals in seconds for each phase of a game
+POLL_INTERVAL_CLOSE = int(os.getenv("LIVE_POLL_INTERVAL_CLOSE", "20"))      # two-minute warnings and overtime
+POLL_INTERVAL_LIVE = int(os.getenv("LIVE_POLL_INTERVAL_LIVE", "60"))        # normal game play
+POLL_INTERVAL_BREAK = int(os.getenv("LIVE_POLL_INTERVAL_BREAK", "300"))     # halftime and suspensions
+POLL_INTERVAL_KICKOFF = int(os.getenv("LIVE_POLL_INTERVAL_KICKOFF", "120"))  # past kickoff but not reported live yet
+
+# How long to sleep at most before re-reading the games table
+SLATE_REFRESH_INTERVAL = int(os.getenv("LIVE_SLATE_REFRESH_INTERVAL", "600"))
+
+# Games whose kickoff falls inside this window around "now" make up the slate
+SLATE_LOOKBACK = timedelta(hours=int(os.getenv("LIVE_SLATE_LOOKBACK_HOURS", "8")))
+SLATE_LOOKAHEAD = timedelta(hours=int(os.getenv("LIVE_SLATE_LOOKAHEAD_HOURS", "16")))
+
+# Function to load the unfinished games of the current slate that still have pending picks
+def load_slate_games(now):
+    with session(dictionary=True) as cursor:
+        cursor.execute("""
+            SELECT g.game_id, g.game_time, g.game_status_code
+            FROM games g
+            WHERE g.game_time BETWEEN %s AND %s
+              AND g.game_status_code NOT IN (%s, %s)
+              AND EXISTS (SELECT 1 FROM picks p WHERE p.game_id = g.game_id AND p.is_successful = 0)
+        """, (now - SLATE_LOOKBACK, now + SLATE_LOOKAHEAD, *FINISHED_STATUS_CODES))
+        return cursor.fetchall()
+
+# Function to convert a "M:SS" game clock into seconds remaining in the period
+def parse_game_clock(game_clock):
+    try:
+        minutes, seconds = str(game_clock).split(":")
+        return int(minutes) * 60 + int(seconds)
+    except (TypeError, ValueError):
+        return None
+
+# Function to choose how long to wait before polling a game again, based on its latest box score
+def next_poll_interval(box_score):
+    status_code = seasonCalendar.game_status_code(box_score)
+    if status_code is None:
+        # Status unknown, keep polling at the normal live cadence until the API reports one
+        logging.warning(f"Game {box_score.get('gameID')} has no usable status code ({box_score.get('gameStatusCode')!r}).")
+        return POLL_INTERVAL_LIVE
+    if status_code in FINISHED_STATUS_CODES:
+        return None
+    if status_code == STATUS_SCHEDULED:
+        return POLL_INTERVAL_KICKOFF
+    if status_code == STATUS_SUSPENDED:
+        return POLL_INTERVAL_BREAK
+
+    period = str(box_score.get("currentPeriod", ""))
+    game_status = str(box_score.get("gameStatus", ""))
+    if "Half" in period or "Half" in game_status:
+        return POLL_INTERVAL_BREAK
+
+    # Scoring clusters at the end of each half and in overtime, so poll most often then
+    clock = parse_game_clock(box_score.get("gameClock"))
+    if period == "OT" or (period in ("2nd", "4th") and clock is not None and clock <= 120):
+        return POLL_INTERVAL_CLOSE
+
+    return POLL_INTERVAL_LIVE
+
+# Function to work out which games are due a poll, and when the next one will be
+def due_games(games, next_polls, now):
+    due = []
+    wake_at = now + timedelta(seconds=SLATE_REFRESH_INTERVAL)
+
+    for game in games:
+        game_id = game['game_id']
+        if game_id in next_polls:
+            poll_at = next_polls[game_id]
+        elif game['game_status_code'] == STATUS_LIVE:
+            poll_at = now
+        else:
+            # Scheduled games are not polled at all until kickoff
+            poll_at = seasonCalendar.stored_game_time(game['game_time'])
+
+        if poll_at <= now:
+            due.append(game_id)
+        else:
+            wake_at = min(wake_at, poll_at)
+
+    return due, wake_at
+
+# Asynchronous function to score one batch of due games using the scorepicks pipeline
+async def poll_games(game_ids, next_polls, finished):
+    picks_by_game, box_scores = await scorepicks.run_scoring_pipeline(game_ids)
+
+    # Stretch the intervals when live scoring is spending faster than the monthly budget allows
+    multiplier = await asyncio.to_thread(apiBudget.interval_multiplier, "liveScoring")
+
+    # Games whose picks have all been resolved have nothing left to score
+    finished.update(set(game_ids) - set(picks_by_game))
+
+    now = datetime.now()
+    for game_id in picks_by_game:
+        box_score = box_scores.get(game_id)
+        if box_score is None:
+            # Fetch failed, try again at the normal live cadence
+            next_polls[game_id] = now + timedelta(seconds=POLL_INTERVAL_LIVE)
+            continue
+
+        interval = next_poll_interval(box_score)
+        if interval is None:
+            logging.info(f"Game {game_id} is finished ({box_score.get('gameStatus')}). No longer polling it.")
+            next_polls.pop(game_id, None)
+            finished.add(game_id)
+        else:
+            interval = int(interval * multiplier)
+            next_polls[game_id] = now + timedelta(seconds=interval)
+            logging.info(f"Next poll for game {game_id} in {interval}s ({box_score.get('currentPeriod')} {box_score.get('gameClock')}).")
+
+# Main loop of the live scoring service
+async def run_live_scoring():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    next_polls = {}
+    finished = set()
+
+    # Deliver queued touchdown notifications in the background so polling never waits on the webhook
+    outbox_worker = asyncio.create_task(outbox.run_worker(stop_event))
+
+    while not stop_event.is_set():
+        # The slate can last many hours, keep the scoring lock's connection alive and make sure it is still ours
+        if not await asyncio.to_thread(jobLock.keep_lock, "scoring"):
+            logging.error("Another scoring run holds the lock now. Shutting down.")
+            break
+
+        now = datetime.now()
+        games = await asyncio.to_thread(load_slate_games, now)
+        games = [game for game in games if game['game_id'] not in finished]
+
+        if not games:
+            logging.info("No unfinished games with pending picks left in the slate. Shutting down.")
+            break
+
+        due, wake_at = due_games(games, next_polls, now)
+        if due:
+            try:
+                await poll_games(due, next_polls, finished)
+            except Exception as e:
+                logging.error(f"Error while polling games {due}: {e}")
+                logging.error(traceback.format_exc())
+                for game_id in due:
+                    next_polls[game_id] = datetime.now() + timedelta(seconds=POLL_INTERVAL_LIVE)
+            continue
+
+        sleep_for = max((wake_at - datetime.now()).total_seconds(), 1)
+        logging.debug(f"Sleeping {sleep_for:.0f}s until the next poll.")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=sleep_for)
+        except asyncio.TimeoutError:
+            pass
+
+    # Let the outbox worker make a final delivery pass before stopping
+    stop_event.set()
+    await outbox_worker
+    await outbox.drain_outbox()
+
+    # The Tank01 session is kept alive across polls and only closed when the service stops
+    await tank01.close_session()
+    await close_async_pool()
+    logging.info(f"Database pool stats: {pool_stats()}")
+    logging.info("Live scoring service stopped.")
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="logs/live_scoring.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    logging.info("Starting live scoring service.")
+    with jobLock.single_flight("scoring") as should_run:
+        if should_run:
+            asyncio.run(run_live_scoring())
@@ -0,0 +1,22 @@
+-- Make month_year the unique key of api_usage, so apiUsage.flush_api_usage() can add a job's calls
+-- to the month with a single INSERT ... ON DUPLICATE KEY UPDATE.
+-- Until this has run, the jobs fall back to UPDATE-then-INSERT and log a warning on their first flush.
+--
+-- Run once, with the jobs stopped:
+--   mysql -h "$MYSQL_HOST" -u "$MYSQL_USER" -p "$MYSQL_DB" < migrations/001_api_usage_month_key.sql
+
+-- The baseline could insert a second row for a month, so the rows of any duplicated month are first merged into one.
+CREATE TEMPORARY TABLE api_usage_merged AS
+    SELECT month_year, SUM(request_count) AS request_count, MAX(request_time) AS request_time
+    FROM api_usage
+    GROUP BY month_year
+    HAVING COUNT(*) > 1;
+
+DELETE api_usage FROM api_usage JOIN api_usage_merged USING (month_year);
+
+INSERT INTO api_usage (month_year, request_count, request_time)
+    SELECT month_year, request_count, request_time FROM api_usage_merged;
+
+DROP TEMPORARY TABLE api_usage_merged;
+
+ALTER TABLE api_usage ADD UNIQUE KEY uq_api_usage_month (month_year);
@@ -0,0 +1,48 @@
+import re
+import sys
+import argparse
+import subprocess
+from datetime import datetime
+
+# Entries the old create_game_schedules.py added through python-crontab, one per job and game, tagged "# week_N_game_ID".
+# scheduler.py now runs these jobs from the job_schedule table, so any left in the crontab would run every job twice.
+LEGACY_ENTRY = re.compile(r"#\s*week_\d+_game_\S+\s*$")
+
+# Function to read the current user's crontab, empty when there is none
+def read_crontab():
+    result = subprocess.run(["crontab", "-l"], capture_output=True, text=True)
+    if result.returncode != 0:
+        if "no crontab" in result.stderr.lower():
+            return ""
+        raise RuntimeError(f"crontab -l failed: {result.stderr.strip()}")
+    return result.stdout
+
+# Function to split the crontab into the lines to keep and the legacy per-game entries
+def split_legacy_entries(crontab):
+    kept, removed = [], []
+    for line in crontab.splitlines():
+        (removed if LEGACY_ENTRY.search(line) and not line.lstrip().startswith("#") else kept).append(line)
+    return kept, removed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove the per-game crontab entries installed by the old create_game_schedules.py.")
+    parser.add_argument("--apply", action="store_true", help="Rewrite the crontab (without it, only list the entries)")
+    args = parser.parse_args()
+
+    crontab = read_crontab()
+    kept, removed = split_legacy_entries(crontab)
+    for line in removed:
+        print(f"legacy entry: {line}")
+
+    if not removed:
+        print("No legacy per-game crontab entries found.")
+        sys.exit(0)
+    if not args.apply:
+        print(f"{len(removed)} legacy entries found. Run again with --apply to remove them.")
+        sys.exit(0)
+
+    backup = f"crontab-backup-{datetime.now():%Y%m%d-%H%M%S}.txt"
+    with open(backup, "w", encoding="utf-8") as f:
+        f.write(crontab)
+    subprocess.run(["crontab", "-"], input="\n".join(kept) + "\n", text=True, check=True)
+    print(f"Removed {len(removed)} legacy entries. The previous crontab was saved to {backup}.")
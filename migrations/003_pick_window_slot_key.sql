@@ -0,0 +1,14 @@
+-- Give pick_window one row per kickoff slot, so the INSERT IGNORE in scheduleUpdate.update_pick_window_table()
+-- stays idempotent when two schedule syncs overlap.
+-- Until this has run, scheduleUpdate.py still skips the slots it finds stored, but two overlapping runs could both insert one.
+--
+-- Run once, with the jobs stopped:
+--   mysql -h "$MYSQL_HOST" -u "$MYSQL_USER" -p "$MYSQL_DB" < migrations/003_pick_window_slot_key.sql
+
+-- Duplicate slots from before the key existed would block it, the oldest row of each is kept.
+DELETE duplicate FROM pick_window duplicate
+JOIN pick_window original
+  ON original.week = duplicate.week AND original.season = duplicate.season
+ AND original.start_time = duplicate.start_time AND original.id < duplicate.id;
+
+ALTER TABLE pick_window ADD UNIQUE KEY uq_pick_window_slot (week, season, start_time);
@@ -0,0 +1,241 @@
+import aiohttp
+import asyncio
+import os
+import sys
+import json
+import logging
+import argparse
+import traceback
+import time
+from dotenv import load_dotenv
+from database import session, async_session, close_async_pool, pool_stats
+import instrumentation
+import jobLock
+
+# Load environment variables
+load_dotenv()
+
+# Webhook endpoints of the bot, per kind of notification
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "http://localhost:3000")
+WEBHOOK_PATHS = {
+    "touchdown": "/webhook/player-touchdown",
+    "injury": "/webhook/player-injury",
+}
+
+# Delivery settings
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+RETRY_BASE_SECONDS = 30
+RETRY_CAP_SECONDS = 3600
+
+# Rows being delivered are leased for this long, so a crashed worker's rows are picked up again
+CLAIM_LEASE_SECONDS = 300
+
+CREATE_OUTBOX_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        dedupe_key VARCHAR(191) NOT NULL,
+        kind VARCHAR(32) NOT NULL,
+        payload TEXT NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        last_error VARCHAR(255),
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        sent_at DATETIME NULL,
+        UNIQUE KEY uq_outbox_dedupe (dedupe_key),
+        KEY idx_outbox_due (status, next_attempt_at)
+    )
+"""
+
+ENQUEUE_SQL = """
+    INSERT IGNORE INTO notification_outbox (dedupe_key, kind, payload)
+    VALUES (%s, %s, %s)
+"""
+
+_outbox_table_ready = False
+
+# Function to create the outbox table if it does not exist yet (run before any transaction that enqueues)
+def ensure_outbox_table():
+    global _outbox_table_ready
+    if _outbox_table_ready:
+        return
+    with session() as cursor:
+        cursor.execute(CREATE_OUTBOX_TABLE_SQL)
+    _outbox_table_ready = True
+
+# Asynchronous version of ensure_outbox_table() for jobs running on the async database pool
+async def async_ensure_outbox_table():
+    global _outbox_table_ready
+    if _outbox_table_ready:
+        return
+    async with async_session() as cursor:
+        await cursor.execute(CREATE_OUTBOX_TABLE_SQL)
+    _outbox_table_ready = True
+
+# Function to turn (dedupe_key, kind, payload) notifications into outbox rows
+def outbox_rows(notifications):
+    return [(dedupe_key, kind, json.dumps(payload)) for dedupe_key, kind, payload in notifications]
+
+# Function to queue notifications inside the caller's transaction, ignoring any already queued under the same key
+def enqueue(cursor, notifications):
+    if not notifications:
+        return 0
+    cursor.executemany(ENQUEUE_SQL, outbox_rows(notifications))
+    logging.info(f"Queued {cursor.rowcount} of {len(notifications)} notifications.")
+    return cursor.rowcount
+
+# Asynchronous version of enqueue() for transactions on the async database pool
+async def async_enqueue(cursor, notifications):
+    if not notifications:
+        return 0
+    await cursor.executemany(ENQUEUE_SQL, outbox_rows(notifications))
+    logging.info(f"Queued {cursor.rowcount} of {len(notifications)} notifications.")
+    return cursor.rowcount
+
+# Function to get how long to wait before the next delivery attempt
+def retry_delay(attempts):
+    return min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_CAP_SECONDS)
+
+# Asynchronous function to lease a batch of due notifications to this worker
+async def claim_due(limit):
+    async with async_session(dictionary=True) as cursor:
+        await cursor.execute("""
+            SELECT id, dedupe_key, kind, payload, attempts FROM notification_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= NOW()
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        rows = await cursor.fetchall()
+        if rows:
+            placeholders = ", ".join(["%s"] * len(rows))
+            await cursor.execute(f"""
+                UPDATE notification_outbox
+                SET status = 'sending', next_attempt_at = NOW() + INTERVAL %s SECOND
+                WHERE id IN ({placeholders})
+            """, [CLAIM_LEASE_SECONDS] + [row['id'] for row in rows])
+    return rows
+
+# Asynchronous function to post one notification to the bot, returning None on success or the error
+async def deliver(session, semaphore, row):
+    url = WEBHOOK_BASE_URL + WEBHOOK_PATHS.get(row['kind'], "")
+    headers = {
+        "Authorization": os.getenv("WEBHOOK_SECRET") or "",
+        "Content-Type": "application/json",
+        # Lets the receiver drop a notification it has already handled if an acknowledgement was lost
+        "Idempotency-Key": row['dedupe_key'],
+    }
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            async with session.post(url, data=row['payload'], headers=headers) as response:
+                instrumentation.record_http("webhook", row['kind'], response.status, time.perf_counter() - start)
+                if 200 <= response.status < 300:
+                    logging.info(f"Delivered {row['kind']} notification {row['dedupe_key']}")
+                    return None
+                error_text = await response.text()
+                return f"{response.status} - {error_text}"[:255]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            instrumentation.record_http("webhook", row['kind'], type(e).__name__, time.perf_counter() - start)
+            return repr(e)[:255]
+
+# Asynchronous function to record the outcome of a delivered batch
+async def record_results(rows, errors):
+    sent_ids = [row['id'] for row, error in zip(rows, errors) if error is None]
+    failures = [
+        (OUTBOX_MAX_ATTEMPTS, retry_delay(row['attempts'] + 1), error, row['id'])
+        for row, error in zip(rows, errors) if error is not None
+    ]
+
+    async with async_session() as cursor:
+        if sent_ids:
+            placeholders = ", ".join(["%s"] * len(sent_ids))
+            await cursor.execute(f"""
+                UPDATE notification_outbox SET status = 'sent', attempts = attempts + 1, sent_at = NOW()
+                WHERE id IN ({placeholders})
+            """, sent_ids)
+        if failures:
+            # attempts is updated first, so the status check sees the new count
+            await cursor.executemany("""
+                UPDATE notification_outbox
+                SET attempts = attempts + 1,
+                    status = IF(attempts >= %s, 'failed', 'pending'),
+                    next_attempt_at = NOW() + INTERVAL %s SECOND,
+                    last_error = %s
+                WHERE id = %s
+            """, failures)
+
+    for row, error in zip(rows, errors):
+        if error is not None:
+            level = logging.ERROR if row['attempts'] + 1 >= OUTBOX_MAX_ATTEMPTS else logging.WARNING
+            logging.log(level, f"Failed to deliver {row['kind']} notification {row['dedupe_key']} (attempt {row['attempts'] + 1}): {error}")
+    return len(sent_ids), len(failures)
+
+# Asynchronous function to deliver every due notification, returning (sent, failed)
+async def drain_outbox(concurrency=OUTBOX_CONCURRENCY, batch_size=OUTBOX_BATCH_SIZE):
+    await async_ensure_outbox_table()
+    sent = failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT)
+
+    async with aiohttp.ClientSession(timeout=timeout) as http_session:
+        while True:
+            rows = await claim_due(batch_size)
+            if not rows:
+                break
+            errors = await asyncio.gather(*(deliver(http_session, semaphore, row) for row in rows))
+            batch_sent, batch_failed = await record_results(rows, errors)
+            sent += batch_sent
+            failed += batch_failed
+            if len(rows) < batch_size:
+                break
+
+    if sent or failed:
+        logging.info(f"Outbox drained: {sent} delivered, {failed} failed and rescheduled.")
+    return sent, failed
+
+# Asynchronous function to keep draining the outbox until stop_event is set, for long-running services
+async def run_worker(stop_event, poll_seconds=OUTBOX_POLL_SECONDS):
+    while not stop_event.is_set():
+        try:
+            await drain_outbox()
+        except Exception as e:
+            logging.error(f"Error while draining the notification outbox: {e}")
+            logging.error(traceback.format_exc())
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+# Asynchronous function to drain once or keep watching the outbox from the command line
+async def main(watch):
+    try:
+        if watch:
+            await run_worker(asyncio.Event())
+        else:
+            await drain_outbox()
+    finally:
+        await close_async_pool()
+        logging.info(f"Database pool stats: {pool_stats()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deliver queued touchdown and injury notifications.")
+    parser.add_argument("--watch", action="store_true", help="Keep polling the outbox instead of draining it once")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename="logs/outbox.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    with jobLock.single_flight("outbox") as should_run:
+        if should_run:
+            try:
+                asyncio.run(main(args.watch))
+            except KeyboardInterrupt:
+                sys.exit(0)
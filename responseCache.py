@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import atomicFile
+
+# Directory shared by every job on this host, so back-to-back cron jobs reuse one download
+CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "cache/tank01")
+
+# How long a cached response is served without asking the API again, per endpoint (endpoints not listed are never cached)
+CACHE_TTLS = {
+    "getNFLTeams": int(os.getenv("CACHE_TTL_TEAMS", str(24 * 3600))),
+    "getNFLPlayerList": int(os.getenv("CACHE_TTL_PLAYER_LIST", str(45 * 60))),
+    # getNFLGamesForWeek is not cached, it carries the game status the schedule sync writes
+}
+
+# Separator between an entry's metadata and its body in the cache file
+BODY_MARKER = ',"body":'
+
+# Function to get the cache TTL for an endpoint, or None when it should not be cached
+def ttl_for(endpoint):
+    ttl = CACHE_TTLS.get(endpoint)
+    return ttl if ttl and ttl > 0 else None
+
+# Function to build the cache file path for an endpoint and its query parameters
+def cache_path(endpoint, params=None):
+    key = json.dumps([endpoint, sorted((params or {}).items())], default=str)
+    return os.path.join(CACHE_DIR, f"{endpoint}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.json")
+
+# Function to read a cached response, returning None when there is no usable entry
+def load(endpoint, params=None):
+    try:
+        with open(cache_path(endpoint, params), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable cache entry for {endpoint}: {e}")
+        return None
+
+# Function to read only the metadata of a cached entry, without loading its body.
+# Entries are always written with the body last, so everything before it is a small JSON object.
+def load_header(endpoint, params=None):
+    try:
+        with open(cache_path(endpoint, params), "r", encoding="utf-8") as f:
+            prefix = ""
+            while BODY_MARKER not in prefix:
+                chunk = f.read(4096)
+                if not chunk:
+                    return None
+                prefix += chunk
+        return json.loads(prefix[:prefix.index(BODY_MARKER)] + "}")
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable cache entry for {endpoint}: {e}")
+        return None
+
+# Function to check whether a cached entry is still within its TTL
+def is_fresh(entry, ttl):
+    return time.time() - entry.get("fetched_at", 0) < ttl
+
+# Function to get how old a cached entry is in seconds
+def age_of(entry):
+    return int(time.time() - entry.get("fetched_at", 0))
+
+# Function to build the conditional request headers for revalidating a cached entry
+def validator_headers(entry):
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+# Function to build the metadata stored ahead of a cached body
+def entry_header(endpoint, params, etag=None, last_modified=None):
+    return {
+        "endpoint": endpoint,
+        "params": params or {},
+        "fetched_at": time.time(),
+        "etag": etag,
+        "last_modified": last_modified,
+    }
+
+# Function to write a cache entry atomically, so readers in other processes never see a partial file
+def store(endpoint, params, body, etag=None, last_modified=None):
+    entry = entry_header(endpoint, params, etag, last_modified)
+    entry["body"] = body
+
+    try:
+        # Compact separators, load_header() finds the body by BODY_MARKER
+        atomicFile.write_json(cache_path(endpoint, params), entry, separators=(",", ":"))
+    except OSError as e:
+        # A cache that cannot be written only costs an extra download next time
+        logging.warning(f"Could not write cache entry for {endpoint}: {e}")
+    return entry
+
+# Function to mark a cached entry as fresh again after the API confirmed it has not changed
+def refresh(endpoint, params, entry):
+    return store(endpoint, params, entry.get("body"), entry.get("etag"), entry.get("last_modified"))
+
+# Function to start a cache entry whose body array is written one item at a time, returning None if the cache is not writable
+def open_stream_entry(endpoint, params, etag=None, last_modified=None):
+    header = json.dumps(entry_header(endpoint, params, etag, last_modified), separators=(",", ":"))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-", suffix=".json")
+        f = os.fdopen(fd, "w", encoding="utf-8")
+        f.write(header[:-1] + BODY_MARKER + "[")
+    except OSError as e:
+        logging.warning(f"Could not write cache entry for {endpoint}: {e}")
+        return None
+    return {"endpoint": endpoint, "params": params, "file": f, "tmp_path": tmp_path, "items": 0}
+
+# Function to append the raw JSON of one body item to a streamed cache entry
+def write_stream_item(writer, raw_item):
+    if writer["items"]:
+        writer["file"].write(",")
+    writer["file"].write(raw_item)
+    writer["items"] += 1
+
+# Function to finish a streamed cache entry, only replacing the old entry if the whole body was received
+def close_stream_entry(writer, complete):
+    try:
+        if complete:
+            writer["file"].write("]}")
+        writer["file"].close()
+        if complete:
+            os.replace(writer["tmp_path"], cache_path(writer["endpoint"], writer["params"]))
+            return
+    except OSError as e:
+        logging.warning(f"Could not write cache entry for {writer['endpoint']}: {e}")
+    try:
+        os.unlink(writer["tmp_path"])
+    except OSError:
+        pass
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import logging
+
+# Number of player rows written per multi-row statement
+ROSTER_SYNC_CHUNK_SIZE = int(os.getenv("ROSTER_SYNC_CHUNK_SIZE", "500"))
+
+# Columns of the players table kept in sync with the API, in row order
+PLAYER_COLUMNS = (
+    "player_id", "player_name", "team_name", "team_id", "position",
+    "is_free_agent", "injury_status", "headshot_url", "byeweek",
+)
+
+SELECT_STORED_PLAYERS_SQL = f"SELECT {', '.join(PLAYER_COLUMNS)} FROM players"
+
+UPSERT_PLAYERS_SQL = """
+    INSERT INTO players (player_id, player_name, team_name, team_id, position, is_free_agent, injury_status, headshot_url, last_updated, byeweek)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s)
+    ON DUPLICATE KEY UPDATE
+        player_name = VALUES(player_name),
+        team_name = VALUES(team_name),
+        team_id = VALUES(team_id),
+        position = VALUES(position),
+        is_free_agent = VALUES(is_free_agent),
+        injury_status = VALUES(injury_status),
+        headshot_url = VALUES(headshot_url),
+        last_updated = CURRENT_TIMESTAMP,
+        byeweek = VALUES(byeweek)
+"""
+
+# Function to turn one player record from the API into a players row
+def player_row(player, team_mapping, default_injury_status="Unknown"):
+    team_name = player.get("team")
+    return (
+        player.get("playerID"),
+        player.get("longName"),
+        team_name,
+        player.get("teamID"),
+        player.get("pos"),
+        1 if player.get("isFreeAgent", "False") == "True" else 0,
+        (player.get("injury") or {}).get("designation", default_injury_status),
+        player.get("espnHeadshot"),
+        team_mapping.get(team_name),
+    )
+
+# Function to fingerprint a players row, normalising types so API strings and DB values compare equal
+def row_fingerprint(row):
+    values = [None if value is None else str(value) for value in row[1:]]
+    return hashlib.sha1(json.dumps(values).encode("utf-8")).hexdigest()
+
+# Function to fingerprint every stored player row, keyed by player_id
+def stored_fingerprints(stored_rows):
+    return {str(row[0]): row_fingerprint(row) for row in stored_rows}
+
+# Function to split API rows into new, changed and unchanged players
+def plan_roster_sync(rows, fingerprints):
+    inserts = []
+    updates = []
+    unchanged = 0
+
+    # The API occasionally repeats a player, the last record wins
+    latest = {str(row[0]): row for row in rows if row[0] is not None}
+
+    for player_id, row in latest.items():
+        stored = fingerprints.get(player_id)
+        if stored is None:
+            inserts.append(row)
+        elif stored != row_fingerprint(row):
+            updates.append(row)
+        else:
+            unchanged += 1
+
+    return inserts, updates, unchanged
+
+# Function to split rows into chunks for multi-row statements
+def chunked(rows, size=ROSTER_SYNC_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+# Asynchronous generator grouping a stream of players into lists of at most `size`, so only one batch is in memory
+async def stream_batches(players, size=ROSTER_SYNC_CHUNK_SIZE):
+    batch = []
+    async for player in players:
+        batch.append(player)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Function to log the outcome of a roster sync
+def log_sync_summary(inserted, updated, unchanged, statements):
+    logging.info(
+        f"Roster sync complete: {inserted} inserted, {updated} updated, {unchanged} unchanged "
+        f"({statements} write statements)."
+    )
@@ -1,11 +1,55 @@
-import aiohttp
 import asyncio
 import os
+import json
 import logging
-from datetime import datetime, date
-import pytz
-from database import get_db_connection
+import argparse
+from datetime import datetime, timedelta
+from database import async_session, close_async_pool, pool_stats
+import apiUsage
+import atomicFile
+import rosterSync
+import tank01
+import seasonCalendar
+import jobLock
 import traceback
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# First week of the season the league plays, pick windows are only opened from this week on
+LEAGUE_START_WEEK = int(os.getenv("LEAGUE_START_WEEK", "1"))
+
+# Between full-season refreshes only the current and next week are fetched, the rest of the schedule rarely changes
+SCHEDULE_FULL_REFRESH_HOURS = int(os.getenv("SCHEDULE_FULL_REFRESH_HOURS", "24"))
+SCHEDULE_SYNC_STATE = os.getenv("SCHEDULE_SYNC_STATE", "cache/schedule_sync.json")
+
+# Columns of the games table kept in sync with the API, in row order
+GAME_COLUMNS = (
+    "game_id", "season_type", "week", "home_team", "away_team", "teamID_home", "teamID_away", "game_time",
+    "game_status", "game_status_code", "neutral_site", "espn_link", "cbs_link", "season",
+)
+
+UPSERT_GAMES_SQL = """
+    INSERT INTO games (game_id, season_type, week, home_team, away_team, teamID_home, teamID_away, game_time,
+                       game_status, game_status_code, neutral_site, espn_link, cbs_link, season, last_updated)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON DUPLICATE KEY UPDATE
+        season_type = VALUES(season_type),
+        week = VALUES(week),
+        home_team = VALUES(home_team),
+        away_team = VALUES(away_team),
+        teamID_home = VALUES(teamID_home),
+        teamID_away = VALUES(teamID_away),
+        game_time = VALUES(game_time),
+        game_status = VALUES(game_status),
+        game_status_code = VALUES(game_status_code),
+        neutral_site = VALUES(neutral_site),
+        espn_link = VALUES(espn_link),
+        cbs_link = VALUES(cbs_link),
+        last_updated = CURRENT_TIMESTAMP,
+        season = VALUES(season)
+"""
 
 logging.basicConfig(
     filename="logs/fetch_schedule.log",
@@ -13,208 +57,229 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-# Timezone definitions
-eastern = pytz.timezone("America/New_York")
-irish = pytz.timezone("Europe/Dublin")
-
-# Week mapping with start dates for each week in the 2024 season
-week_mapping = {
-    7: date(2024, 10, 17),
-    8: date(2024, 10, 24),
-    9: date(2024, 10, 31),
-    10: date(2024, 11, 7),
-    11: date(2024, 11, 14),
-    12: date(2024, 11, 21),
-    13: date(2024, 11, 28),
-    14: date(2024, 12, 5),
-    15: date(2024, 12, 12),
-    16: date(2024, 12, 19),
-    17: date(2024, 12, 26),
-    18: date(2025, 1, 2)
-}
-
-# Function to convert ET game time to Irish time
-def convert_to_irish_time(game_date, game_time_et):
-    if game_time_et == "TBD" or not game_time_et:
+# Function to read when the whole season was last fetched
+def load_sync_state():
+    try:
+        with open(SCHEDULE_SYNC_STATE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Function to save the schedule sync state atomically
+def save_sync_state(state):
+    try:
+        atomicFile.write_json(SCHEDULE_SYNC_STATE, state)
+    except OSError as e:
+        logging.warning(f"Could not save the schedule sync state: {e}")
+
+# Function to decide whether this run fetches the whole season, or the weeks that can still change
+def weeks_to_sync(calendar, state, now, force_full=False):
+    if force_full or not calendar["weeks"] or state.get("season") != seasonCalendar.NFL_SEASON:
         return None
     try:
-        game_time_str = game_time_et.replace("a", "AM").replace("p", "PM")
-        game_time_obj = datetime.strptime(game_time_str, "%I:%M%p")
-        game_datetime = datetime.strptime(game_date, "%Y%m%d").replace(
-            hour=game_time_obj.hour, minute=game_time_obj.minute, second=0, microsecond=0, tzinfo=eastern
-        )
-        return game_datetime.astimezone(irish).replace(second=0, microsecond=0)
-    except Exception as e:
-        logging.error(f"Error converting game time: {game_time_et}. Error: {e}")
+        last_full = datetime.fromisoformat(state["last_full_refresh"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if now - last_full >= timedelta(hours=SCHEDULE_FULL_REFRESH_HOURS):
         return None
 
-# Determine the week number based on game date
-def determine_week(game_date):
-    game_date_obj = datetime.strptime(game_date, "%Y%m%d").date()
-    sorted_weeks = sorted(week_mapping.items())
-    for i, (week, start_date) in enumerate(sorted_weeks):
-        if i == len(sorted_weeks) - 1 or (start_date <= game_date_obj < sorted_weeks[i + 1][1]):
-            return week
-    logging.warning(f"Could not determine week for game date: {game_date}")
-    return None
-
-# Asynchronous function to fetch game data from the API
-async def fetch_game_data():
-    url = "https://tank01-nfl-live-in-game-real-time-statistics-nfl.p.rapidapi.com/getNFLGamesForWeek"
-    headers = {
-        "x-rapidapi-key": os.getenv("RAPIDAPI_KEY"),
-        "x-rapidapi-host": "tank01-nfl-live-in-game-real-time-statistics-nfl.p.rapidapi.com"
-    }
-    params = {"week": "all", "seasonType": "reg", "season": "2024"}
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    logging.info("Successfully fetched game schedule from API")
-                    response_data = await response.json()
-                    return response_data.get('body', []), 1
-                else:
-                    error_text = await response.text()
-                    logging.error(f"Failed to fetch game schedule: {response.status} - {error_text}")
-                    return None, 0
-        except aiohttp.ClientError as e:
-            logging.error(f"Error fetching game schedule from API: {e}")
-            return None, 0
-
-# Function to update API usage
-def update_api_usage(api_calls, db, cursor):
-    current_month_year = datetime.now().strftime("%Y-%m")
-
-    # Check the current usage for the month
-    cursor.execute("SELECT request_count FROM api_usage WHERE month_year = %s", (current_month_year,))
-    result = cursor.fetchone()
-
-    if result:
-        new_count = result[0] + api_calls
-        cursor.execute("UPDATE api_usage SET request_count = %s, request_time = NOW() WHERE month_year = %s",
-                       (new_count, current_month_year))
-        logging.info(f"Updated API usage for month {current_month_year}: new count is {new_count}")
-    else:
-        cursor.execute("INSERT INTO api_usage (request_count, request_time, month_year) VALUES (%s, NOW(), %s)",
-                       (api_calls, current_month_year))
-        logging.info(f"Inserted new API usage record for month {current_month_year}: count is {api_calls}")
-
-# Function to update pick_window table
-def update_pick_window_table(games, week, season, db, cursor):
-    game_times = [
-        (convert_to_irish_time(game["gameDate"], game["gameTime"]), game["gameDate"])
-        for game in games if game["gameWeek"] == f"Week {week}"
-    ]
+    current_week = seasonCalendar.current_week(calendar)
+    if current_week is None:
+        # Before the season starts the first week is the one that can change
+        return calendar["weeks"][:1]
+    index = calendar["weeks"].index(current_week)
+    return calendar["weeks"][index:index + 2]
+
+# Asynchronous function to fetch game data from the API, for the given weeks or the whole season
+async def fetch_game_data(weeks=None):
+    season = seasonCalendar.NFL_SEASON
+    if weeks is None:
+        return await tank01.fetch("getNFLGamesForWeek", {"week": "all", "seasonType": "reg", "season": season})
 
-    if not game_times:
-        logging.warning(f"No valid game times for week {week}.")
-        return
+    responses = await tank01.fetch_many([
+        ("getNFLGamesForWeek", {"week": str(week), "seasonType": "reg", "season": season})
+        for week in weeks
+    ])
+    if all(response is None for response in responses):
+        return None
+    games = []
+    for week, response in zip(weeks, responses):
+        if response is None:
+            logging.warning(f"Could not fetch the games of week {week}.")
+            continue
+        games.extend(response)
+    return games
 
-    for start_time, game_date in game_times:
-        if start_time is None:
+# Function to bucket games by week in one pass and collapse each week to its distinct kickoff slots
+def pick_window_slots(games, kickoffs, season, start_week=LEAGUE_START_WEEK):
+    slots_by_week = {}
+    for game in games:
+        week = seasonCalendar.game_week(game)
+        start_time = kickoffs.get(game.get("gameID"))
+        if week is None or week < start_week or start_time is None:
             continue
+        slots_by_week.setdefault(week, set()).add(start_time)
+
+    return [
+        (week, season, start_time.strftime("%A"), start_time, 0)
+        for week in sorted(slots_by_week)
+        for start_time in sorted(slots_by_week[week])
+    ]
+
+# Function to pick the closed windows to remove and the slots to insert, given the stored windows of the synced weeks.
+# Only weeks whose first kickoff is still ahead are realigned, the windows of weeks already under way or played are left alone.
+def plan_pick_windows(slots, existing, now):
+    first_kickoff = {}
+    for week, _, _, start_time, _ in slots:
+        start_time = start_time.replace(tzinfo=None)
+        first_kickoff[week] = min(start_time, first_kickoff.get(week, start_time))
+    upcoming_weeks = {week for week, first in first_kickoff.items() if first > now}
+
+    # Kickoffs stored before the DST-aware conversion were up to an hour off, their windows make way for the corrected ones
+    slot_times = {(week, start_time.replace(tzinfo=None)) for week, _, _, start_time, _ in slots}
+    stale_ids = [
+        window_id for window_id, week, start_time, is_open in existing
+        if week in upcoming_weeks and not is_open and (week, start_time) not in slot_times
+    ]
+    present = {(week, start_time) for window_id, week, start_time, _ in existing if window_id not in set(stale_ids)}
+    to_insert = [slot for slot in slots if (slot[0], slot[3].replace(tzinfo=None)) not in present]
+    return stale_ids, to_insert
+
+# Asynchronous function to realign the pick windows of the upcoming weeks and insert the ones that do not exist yet
+async def update_pick_window_table(slots, season, cursor, now):
+    if not slots:
+        logging.warning(f"No valid game times for season {season}.")
+        return 0
+
+    weeks = sorted({slot[0] for slot in slots})
+    await cursor.execute(f"""
+        SELECT id, week, start_time, is_open FROM pick_window
+        WHERE season = %s AND week IN ({', '.join(['%s'] * len(weeks))})
+    """, [season] + weeks)
+    stale_ids, to_insert = plan_pick_windows(slots, await cursor.fetchall(), now)
+
+    if stale_ids:
+        await cursor.execute(f"DELETE FROM pick_window WHERE id IN ({', '.join(['%s'] * len(stale_ids))})", stale_ids)
+        logging.warning(f"Removed {len(stale_ids)} closed pick windows of upcoming weeks that no longer match a kickoff of season {season}.")
 
-        day_name = start_time.strftime("%A")
-        cursor.execute(
+    # IGNORE keeps overlapping syncs safe where migrations/003_pick_window_slot_key.sql has added the unique slot key
+    if to_insert:
+        await cursor.executemany(
             """
-            SELECT id FROM pick_window 
-            WHERE week = %s AND season = %s AND start_time = %s
+            INSERT IGNORE INTO pick_window (week, season, day_name, start_time, is_open, last_updated)
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
             """,
-            (week, season, start_time)
+            to_insert
         )
-        existing_record = cursor.fetchone()
-
-        if not existing_record:
-            cursor.execute(
-                """
-                INSERT INTO pick_window (week, season, day_name, start_time, is_open, last_updated)
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                """,
-                (week, season, day_name, start_time, 0)
-            )
-            logging.info(f"Inserted new pick window entry for week {week}, season {season}, start time {start_time}")
-        else:
-            logging.debug(f"Duplicate entry skipped for week {week}, season {season}, start time {start_time}")
-
-# Function to upsert game data into the games table
-def upsert_game_data(games, db, cursor):
+    inserted = max(cursor.rowcount, 0) if to_insert else 0
+    logging.info(f"Pick windows for season {season}: {inserted} inserted, {len(slots) - len(to_insert)} already present.")
+    return inserted
+
+# Function to turn one game from the API into a games row, or None if its week is unknown
+def game_row(game, calendar, kickoffs):
+    game_id = game.get("gameID")
+    week = seasonCalendar.week_for_game_date(calendar, game.get("gameDate"))
+    if week is None:
+        logging.warning(f"Skipping game {game_id} due to undefined week.")
+        return None
+
+    game_time = kickoffs.get(game_id)
+    status_code = seasonCalendar.game_status_code(game)
+    if status_code is None:
+        # Stored as scheduled, so live scoring still picks the game up and reads its real status from the box score
+        logging.warning(f"Game {game_id} has no usable status code ({game.get('gameStatusCode')!r}), storing it as scheduled.")
+        status_code = 0
+    return (
+        game_id,
+        game.get("seasonType"),
+        week,
+        game.get("home"),
+        game.get("away"),
+        game.get("teamIDHome"),
+        game.get("teamIDAway"),
+        # Stored as Irish wall-clock time, without the offset, so it compares equal to the DATETIME read back
+        game_time.replace(tzinfo=None) if game_time else None,
+        game.get("gameStatus"),
+        status_code,
+        1 if game.get("neutralSite") == "True" else 0,
+        game.get("espnLink"),
+        game.get("cbsLink"),
+        game.get("season"),
+    )
+
+# Asynchronous function to fingerprint the stored rows of the given games, keyed by game_id
+async def stored_game_fingerprints(game_ids, cursor):
+    fingerprints = {}
+    for chunk in rosterSync.chunked(game_ids):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        await cursor.execute(f"SELECT {', '.join(GAME_COLUMNS)} FROM games WHERE game_id IN ({placeholders})", chunk)
+        for row in await cursor.fetchall():
+            fingerprints[str(row[0])] = rosterSync.row_fingerprint(row)
+    return fingerprints
+
+# Asynchronous function to write the games that are new or changed, skipping the rest, returning (changed, unchanged)
+async def upsert_game_data(games, calendar, kickoffs, cursor):
+    # The API occasionally repeats a game, the last record wins
+    rows = {}
     for game in games:
-        game_id = game.get("gameID")
-        season_type = game.get("seasonType")
-        week = determine_week(game.get("gameDate"))
-        if week is None:
-            logging.warning(f"Skipping game {game_id} due to undefined week.")
-            continue
+        row = game_row(game, calendar, kickoffs)
+        if row is not None and row[0] is not None:
+            rows[str(row[0])] = row
+
+    fingerprints = await stored_game_fingerprints(list(rows), cursor)
+    changed = [row for game_id, row in rows.items() if fingerprints.get(game_id) != rosterSync.row_fingerprint(row)]
+    unchanged = len(rows) - len(changed)
 
-        home_team = game.get("home")
-        away_team = game.get("away")
-        teamID_home = game.get("teamIDHome")
-        teamID_away = game.get("teamIDAway")
-        game_status = game.get("gameStatus")
-        game_status_code = int(game.get("gameStatusCode", 0))
-        neutral_site = 1 if game.get("neutralSite") == "True" else 0
-        espn_link = game.get("espnLink")
-        cbs_link = game.get("cbsLink")
-        season = game.get("season")
-        game_time = convert_to_irish_time(game.get("gameDate"), game.get("gameTime"))
-
-        # Perform update or insert
+    written = 0
+    for chunk in rosterSync.chunked(changed):
         try:
-            cursor.execute(
-                """
-                INSERT INTO games (game_id, season_type, week, home_team, away_team, teamID_home, teamID_away, game_time,
-                                   game_status, game_status_code, neutral_site, espn_link, cbs_link, last_updated, season)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s)
-                ON DUPLICATE KEY UPDATE
-                    season_type = VALUES(season_type),
-                    week = VALUES(week),
-                    home_team = VALUES(home_team),
-                    away_team = VALUES(away_team),
-                    teamID_home = VALUES(teamID_home),
-                    teamID_away = VALUES(teamID_away),
-                    game_time = VALUES(game_time),
-                    game_status = VALUES(game_status),
-                    game_status_code = VALUES(game_status_code),
-                    neutral_site = VALUES(neutral_site),
-                    espn_link = VALUES(espn_link),
-                    cbs_link = VALUES(cbs_link),
-                    last_updated = CURRENT_TIMESTAMP,
-                    season = VALUES(season)
-                """,
-                (game_id, season_type, week, home_team, away_team, teamID_home, teamID_away, game_time,
-                 game_status, game_status_code, neutral_site, espn_link, cbs_link, season)
-            )
-            logging.info(f"Upsert query executed for game_id: {game_id}")
+            await cursor.executemany(UPSERT_GAMES_SQL, chunk)
+            written += len(chunk)
         except Exception as e:
-            logging.error(f"Error executing upsert for game_id {game_id}: {e}")
+            logging.error(f"Error upserting {len(chunk)} games starting with {chunk[0][0]}: {e}")
             logging.error(traceback.format_exc())
 
+    logging.info(f"Games sync: {written} new or changed written, {unchanged} unchanged skipped.")
+    return written, unchanged
+
 # Main execution with asyncio
-async def main():
+async def main(force_full=False):
     logging.info("Starting TD Showdown game schedule update.")
-    db = get_db_connection()
-    cursor = db.cursor()
     try:
-        games, api_calls = await fetch_game_data()
-        season = 2024  # Define season
+        now = datetime.now()
+        state = load_sync_state()
+        stored_calendar = await asyncio.to_thread(seasonCalendar.load_calendar)
+        weeks = weeks_to_sync(stored_calendar, state, now, force_full)
+        logging.info("Fetching the full season schedule." if weeks is None else f"Fetching the schedule of weeks {weeks}.")
 
-        if games:
-            logging.info(f"Fetched {len(games)} games from the API.")
-            upsert_game_data(games, db, cursor)  # Call to upsert game data directly after fetching games.
-            for week in range(7, 19):  # Only weeks from 7 to 18 as per the given mapping.
-                update_pick_window_table(games, week, season, db, cursor)
+        games = await fetch_game_data(weeks)
+        season = int(seasonCalendar.NFL_SEASON)
 
-        # Update API usage here with the correct arguments
-        update_api_usage(api_calls, db, cursor)
+        async with async_session() as cursor:
+            if games:
+                logging.info(f"Fetched {len(games)} games from the API.")
+                # Week boundaries come from the whole schedule when it was fetched, otherwise from the stored one
+                calendar = seasonCalendar.build_calendar(games) if weeks is None else stored_calendar
+                kickoffs = seasonCalendar.convert_kickoffs(games)
+                await upsert_game_data(games, calendar, kickoffs, cursor)  # Call to upsert game data directly after fetching games.
+                await update_pick_window_table(pick_window_slots(games, kickoffs, season), season, cursor, now)
+        if games and weeks is None:
+            save_sync_state({"season": seasonCalendar.NFL_SEASON, "last_full_refresh": now.isoformat()})
         logging.info("Game schedule update completed successfully.")
     except Exception as e:
         logging.error(f"An error occurred during the schedule update: {e}")
         logging.error(traceback.format_exc())
     finally:
-        cursor.close()
-        db.close()
-        logging.info("Database connection closed.")
+        await tank01.close_session()
+        await apiUsage.async_flush_api_usage()
+        await close_async_pool()
+        logging.info(f"Database pool stats: {pool_stats()}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync the NFL schedule into the games and pick_window tables.")
+    parser.add_argument("--full", action="store_true", help="Fetch the whole season instead of the current and next week")
+    args = parser.parse_args()
+
+    with jobLock.single_flight("scheduleUpdate") as should_run:
+        if should_run:
+            asyncio.run(main(args.full))
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import sys
+import signal
+import logging
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from database import session, pool_stats
+import jobLock
+import seasonCalendar
+
+# Load environment variables
+load_dotenv()
+
+# Directory the job scripts live in, they are run with the same interpreter as the scheduler
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Jobs run for every kickoff slot, as (script, time before kickoff)
+JOB_OFFSETS = [
+    ("scheduleUpdate.py", timedelta(hours=2)),
+    ("playerUpdate.py", timedelta(hours=2)),
+    ("injuryCheck.py", timedelta(minutes=60)),
+    ("injuryCheck.py", timedelta(minutes=45)),
+    ("injuryCheck.py", timedelta(minutes=30)),
+    ("injuryCheck.py", timedelta(minutes=15)),
+    ("liveScoring.py", timedelta(0)),
+]
+
+# How late a job may still start after its scheduled time, anything later is recorded as missed
+MISFIRE_GRACE = {
+    "scheduleUpdate.py": timedelta(minutes=60),
+    "playerUpdate.py": timedelta(minutes=60),
+    "injuryCheck.py": timedelta(minutes=10),
+    "liveScoring.py": timedelta(hours=4),
+}
+DEFAULT_MISFIRE_GRACE = timedelta(minutes=15)
+
+# How far ahead the plan is built, and how often it is rebuilt from the games table
+PLAN_LOOKBACK = timedelta(hours=6)
+PLAN_HORIZON = timedelta(days=8)
+PLAN_REFRESH_SECONDS = int(os.getenv("SCHEDULER_PLAN_REFRESH_SECONDS", "1800"))
+
+# Longest the runner sleeps between checks, so new plans and shutdowns are noticed promptly
+MAX_SLEEP_SECONDS = 60
+
+CREATE_JOB_SCHEDULE_SQL = """
+    CREATE TABLE IF NOT EXISTS job_schedule (
+        id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        job VARCHAR(64) NOT NULL,
+        run_at DATETIME NOT NULL,
+        week INT,
+        games INT NOT NULL DEFAULT 1,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        started_at DATETIME NULL,
+        finished_at DATETIME NULL,
+        exit_code INT NULL,
+        UNIQUE KEY uq_job_schedule (job, run_at),
+        KEY idx_job_schedule_due (status, run_at)
+    )
+"""
+
+_job_schedule_ready = False
+
+# Function to create the job_schedule table if it does not exist yet
+def ensure_job_schedule_table():
+    global _job_schedule_ready
+    if _job_schedule_ready:
+        return
+    with session() as cursor:
+        cursor.execute(CREATE_JOB_SCHEDULE_SQL)
+    _job_schedule_ready = True
+
+# Function to build the plan for a set of games, merging identical (job, time) entries across games sharing a kickoff
+def plan_jobs(games):
+    plan = Counter()
+    weeks = {}
+    for game_time, week in games:
+        kickoff = seasonCalendar.stored_game_time(game_time)
+        for job, offset in JOB_OFFSETS:
+            key = (job, kickoff - offset)
+            plan[key] += 1
+            weeks[key] = week
+    return [(job, run_at, weeks[(job, run_at)], count) for (job, run_at), count in sorted(plan.items(), key=lambda item: item[0][1])]
+
+# Function to store the plan for the given games, removing pending entries whose game has moved
+def store_plan(planned, weeks):
+    ensure_job_schedule_table()
+    with session(dictionary=True) as cursor:
+        if planned:
+            cursor.executemany("""
+                INSERT INTO job_schedule (job, run_at, week, games)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE week = VALUES(week), games = VALUES(games)
+            """, planned)
+
+        stale_ids = []
+        if weeks:
+            placeholders = ", ".join(["%s"] * len(weeks))
+            cursor.execute(f"""
+                SELECT id, job, run_at FROM job_schedule
+                WHERE week IN ({placeholders}) AND status = 'pending'
+            """, list(weeks))
+            wanted = {(job, run_at) for job, run_at, _, _ in planned}
+            stale_ids = [row['id'] for row in cursor.fetchall() if (row['job'], row['run_at']) not in wanted]
+        if stale_ids:
+            cursor.execute(f"DELETE FROM job_schedule WHERE id IN ({', '.join(['%s'] * len(stale_ids))})", stale_ids)
+
+    logging.info(f"Stored {len(planned)} planned jobs for weeks {sorted(weeks)}, removed {len(stale_ids)} that no longer apply.")
+    return len(planned), len(stale_ids)
+
+# Function to plan every job for the games of one week
+def sync_week_plan(week):
+    with session(dictionary=True) as cursor:
+        cursor.execute("SELECT game_time, week FROM games WHERE week = %s AND game_time IS NOT NULL", (week,))
+        games = [(row['game_time'], row['week']) for row in cursor.fetchall()]
+    if not games:
+        logging.info(f"No games found for week {week}.")
+    return store_plan(plan_jobs(games), {week})
+
+# Function to plan every job for the games around now, across whichever weeks they fall in
+def sync_upcoming_plan(now):
+    with session(dictionary=True) as cursor:
+        cursor.execute("""
+            SELECT game_time, week FROM games
+            WHERE game_time IS NOT NULL AND game_time >= %s AND game_time < %s
+        """, (now - PLAN_LOOKBACK, now + PLAN_HORIZON))
+        games = [(row['game_time'], row['week']) for row in cursor.fetchall()]
+    return store_plan(plan_jobs(games), {week for _, week in games})
+
+# Function to mark jobs left running by a previous scheduler process as interrupted
+def recover_interrupted_jobs():
+    ensure_job_schedule_table()
+    with session() as cursor:
+        cursor.execute("""
+            UPDATE job_schedule SET status = 'interrupted', finished_at = NOW()
+            WHERE status = 'running'
+        """)
+        if cursor.rowcount:
+            logging.warning(f"Marked {cursor.rowcount} jobs left running by a previous scheduler as interrupted.")
+
+# Function to claim the jobs that are due now, applying misfire grace and coalescing backlogged runs of the same job
+def claim_due_jobs(now, running_jobs):
+    with session(dictionary=True) as cursor:
+        cursor.execute("""
+            SELECT id, job, run_at FROM job_schedule
+            WHERE status = 'pending' AND run_at <= %s
+            ORDER BY run_at
+            FOR UPDATE
+        """, (now,))
+        due = cursor.fetchall()
+
+        latest = {}
+        missed = []
+        for row in due:
+            grace = MISFIRE_GRACE.get(row['job'], DEFAULT_MISFIRE_GRACE)
+            if now - row['run_at'] > grace:
+                logging.warning(f"Missed {row['job']} scheduled for {row['run_at']} (more than {grace} late).")
+                missed.append(row['id'])
+                continue
+            # Only the latest of several backlogged runs of the same job is worth running
+            if row['job'] in latest:
+                missed.append(latest[row['job']]['id'])
+            latest[row['job']] = row
+
+        to_run = []
+        skipped = []
+        for job, row in latest.items():
+            if job in running_jobs:
+                logging.info(f"{job} scheduled for {row['run_at']} is still running from an earlier slot. Skipping.")
+                skipped.append(row['id'])
+            else:
+                to_run.append(row)
+
+        if missed:
+            cursor.execute(f"UPDATE job_schedule SET status = 'missed' WHERE id IN ({', '.join(['%s'] * len(missed))})", missed)
+        if skipped:
+            cursor.execute(f"UPDATE job_schedule SET status = 'skipped' WHERE id IN ({', '.join(['%s'] * len(skipped))})", skipped)
+        if to_run:
+            ids = [row['id'] for row in to_run]
+            cursor.execute(f"""
+                UPDATE job_schedule SET status = 'running', started_at = NOW()
+                WHERE id IN ({', '.join(['%s'] * len(ids))})
+            """, ids)
+    return to_run
+
+# Function to record how a job run ended
+def finish_job(job_id, exit_code):
+    with session() as cursor:
+        cursor.execute("""
+            UPDATE job_schedule SET status = %s, exit_code = %s, finished_at = NOW()
+            WHERE id = %s
+        """, ("done" if exit_code == 0 else "failed", exit_code, job_id))
+
+# Function to find when the next pending job is due
+def next_run_at():
+    with session() as cursor:
+        cursor.execute("SELECT MIN(run_at) FROM job_schedule WHERE status = 'pending'")
+        result = cursor.fetchone()
+    return result[0] if result else None
+
+# Asynchronous function to run one job script as a child process and record its outcome
+async def run_job(row, running_jobs):
+    job = row['job']
+    running_jobs.add(job)
+    try:
+        logging.info(f"Starting {job} scheduled for {row['run_at']}.")
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(SCRIPT_DIR, job), cwd=SCRIPT_DIR)
+        exit_code = await process.wait()
+        level = logging.INFO if exit_code == 0 else logging.ERROR
+        logging.log(level, f"{job} scheduled for {row['run_at']} finished with exit code {exit_code}.")
+        await asyncio.to_thread(finish_job, row['id'], exit_code)
+    except Exception as e:
+        logging.error(f"Error running {job}: {e}")
+        logging.error(traceback.format_exc())
+        await asyncio.to_thread(finish_job, row['id'], -1)
+    finally:
+        running_jobs.discard(job)
+
+# Main loop of the scheduler service
+async def run_scheduler():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await asyncio.to_thread(recover_interrupted_jobs)
+
+    running_jobs = set()
+    tasks = set()
+    next_plan_at = datetime.min
+
+    while not stop_event.is_set():
+        now = datetime.now()
+        try:
+            if now >= next_plan_at:
+                await asyncio.to_thread(sync_upcoming_plan, now)
+                next_plan_at = now + timedelta(seconds=PLAN_REFRESH_SECONDS)
+
+            for row in await asyncio.to_thread(claim_due_jobs, now, set(running_jobs)):
+                task = asyncio.create_task(run_job(row, running_jobs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            upcoming = await asyncio.to_thread(next_run_at)
+        except Exception as e:
+            logging.error(f"Scheduler error: {e}")
+            logging.error(traceback.format_exc())
+            upcoming = None
+
+        sleep_for = MAX_SLEEP_SECONDS
+        if upcoming is not None:
+            sleep_for = min(max((upcoming - datetime.now()).total_seconds(), 1), MAX_SLEEP_SECONDS)
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=sleep_for)
+        except asyncio.TimeoutError:
+            pass
+
+    # Let jobs that have already started finish and record their outcome
+    if tasks:
+        logging.info(f"Waiting for {len(tasks)} running jobs before stopping.")
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logging.info(f"Database pool stats: {pool_stats()}")
+    logging.info("Scheduler stopped.")
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="logs/scheduler.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    logging.info("Starting scheduler service.")
+    with jobLock.single_flight("scheduler") as should_run:
+        if should_run:
+            asyncio.run(run_scheduler())
@@ -1,153 +1,335 @@
-import requests
+import asyncio
 import os
+import json
+import hashlib
+from collections import defaultdict
 from dotenv import load_dotenv
-import datetime
-from database import get_db_connection
+from database import session, close_async_pool, pool_stats
+import apiUsage
+import apiBudget
+import tank01
+import outbox
+import standings
+import seasonCalendar
+import jobLock
 import logging
 
-logging.basicConfig(
-    filename="logs/score_picks.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
 # Load environment variables from .env file
 load_dotenv()
 
-WEBHOOK_URL = "http://localhost:3000/webhook/player-touchdown"  # Your webhook endpoint URL
-
-# Function to update API usage count
-def update_api_usage(api_calls):
-    current_month_year = datetime.datetime.now().strftime('%Y-%m')
-
-    db = get_db_connection()
-    cursor = db.cursor()
-
-    # Check the current usage for the month
-    cursor.execute("SELECT request_count FROM api_usage WHERE month_year = %s", (current_month_year,))
-    result = cursor.fetchone()
-
-    if result:
-        # Update the count by adding the new API calls
-        new_count = result[0] + api_calls
-        cursor.execute("UPDATE api_usage SET request_count = %s WHERE month_year = %s", (new_count, current_month_year))
-        logging.info(f"Updated API usage for month {current_month_year}: new count is {new_count}")
-    else:
-        # Insert a new row for the current month
-        cursor.execute("INSERT INTO api_usage (month_year, request_count) VALUES (%s, %s)", (current_month_year, api_calls))
-        logging.info(f"Inserted new API usage record for month {current_month_year}: count is {api_calls}")
-
-    db.commit()
-    cursor.close()
-    db.close()
-
-# Function to send touchdown notification via webhook
-def send_touchdown_notification(player_name, tagged_users):
-    headers = {
-        "Authorization": os.getenv("WEBHOOK_SECRET"),
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "playerName": player_name,
-        "taggedUsers": tagged_users
-    }
 
-    try:
-        response = requests.post(WEBHOOK_URL, json=payload, headers=headers)
-        if response.status_code == 200:
-            logging.info(f"Successfully sent touchdown notification for player: {player_name}")
-        else:
-            logging.error(f"Failed to send touchdown notification: {response.status_code} - {response.text}")
-    except requests.RequestException as e:
-        logging.error(f"Error sending touchdown notification: {e}")
+# Maximum number of box score requests in flight at once
+MAX_CONCURRENT_FETCHES = int(os.getenv("SCORE_PICKS_MAX_CONCURRENCY", "5"))
 
-# Function to check if a player has scored and update the game status
-def check_player_scores_and_update_game_status():
-    db = get_db_connection()
-    cursor = db.cursor(dictionary=True)
+# Normal gap between cron-fired scoring runs, stretched by the API budget when needed
+SCORE_PICKS_INTERVAL_MINUTES = int(os.getenv("SCORE_PICKS_INTERVAL_MINUTES", "5"))
 
-    # Initialize API call counter
-    api_calls = 0
+# Function to load every pick that has not been resolved yet, optionally limited to some games
+def load_pending_picks(game_ids=None):
+    if game_ids is not None and not game_ids:
+        return []
 
-    # Fetch all picks where 'is_successful' is still 0
-    cursor.execute('SELECT * FROM picks WHERE is_successful = 0')
-    picks = cursor.fetchall()
+    with session(dictionary=True) as cursor:
+        # Fetch all picks where 'is_successful' is still 0
+        if game_ids is None:
+            cursor.execute('SELECT * FROM picks WHERE is_successful = 0')
+        else:
+            placeholders = ", ".join(["%s"] * len(game_ids))
+            cursor.execute(f'SELECT * FROM picks WHERE is_successful = 0 AND game_id IN ({placeholders})', list(game_ids))
+        picks = cursor.fetchall()
 
     logging.info(f"Fetched {len(picks)} picks with is_successful = 0 to process.")
+    return picks
 
+# Function to group pending picks by game so each box score is only fetched once
+def group_picks_by_game(picks):
+    picks_by_game = defaultdict(list)
     for pick in picks:
-        game_id = pick['game_id']
-        player_id = pick['player_id']
-        pick_id = pick['id']
-
-        # Fetch the game box score data from the API
-        api_url = "https://tank01-nfl-live-in-game-real-time-statistics-nfl.p.rapidapi.com/getNFLBoxScore"
-        querystring = {"gameID": game_id, "playByPlay": "false"}
-        headers = {
-            "x-rapidapi-key": os.getenv("RAPIDAPI_KEY"),
-            "x-rapidapi-host": "tank01-nfl-live-in-game-real-time-statistics-nfl.p.rapidapi.com"
+        picks_by_game[pick['game_id']].append(pick)
+    return picks_by_game
+
+# Asynchronous function to fetch each distinct box score once, with a bounded number of requests in flight
+async def fetch_box_scores(game_ids):
+    requests_to_send = [("getNFLBoxScore", {"gameID": game_id, "playByPlay": "false"}) for game_id in game_ids]
+    results = await tank01.fetch_many(requests_to_send, limit=MAX_CONCURRENT_FETCHES)
+
+    return {game_id: box_score for game_id, box_score in zip(game_ids, results) if box_score is not None}
+
+# Set once the scoring cursor tables have been checked in this process
+_scoring_cursor_tables_ready = False
+
+# Function to create the per-game scoring cursor tables if they do not exist yet
+def ensure_scoring_cursor_tables():
+    global _scoring_cursor_tables_ready
+    if _scoring_cursor_tables_ready:
+        return
+
+    with session() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS scoring_cursor (
+                game_id VARCHAR(32) NOT NULL PRIMARY KEY,
+                response_hash CHAR(64) NOT NULL,
+                plays_seen INT NOT NULL DEFAULT 0,
+                last_updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS scored_plays (
+                game_id VARCHAR(32) NOT NULL,
+                play_fingerprint CHAR(40) NOT NULL,
+                score_type VARCHAR(16),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (game_id, play_fingerprint)
+            )
+        """)
+    _scoring_cursor_tables_ready = True
+
+# Function to build a stable fingerprint for a scoring play
+def play_fingerprint(play):
+    player_ids = play.get("playerIDs", [])
+    if not isinstance(player_ids, str):
+        player_ids = sorted(str(player_id) for player_id in player_ids)
+    key = [play.get("scorePeriod"), play.get("scoreTime"), play.get("team"), play.get("scoreType"), player_ids]
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+# Function to hash the parts of a box score that scoring depends on
+def box_score_hash(box_score):
+    key = {
+        "gameStatus": box_score.get("gameStatus"),
+        "gameStatusCode": box_score.get("gameStatusCode"),
+        "scoringPlays": box_score.get("scoringPlays", []),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Function to load the stored response hash and already-seen plays for each game
+def load_scoring_cursors(game_ids):
+    cursors = {game_id: {"response_hash": None, "seen": set()} for game_id in game_ids}
+    if not game_ids:
+        return cursors
+
+    ensure_scoring_cursor_tables()
+    outbox.ensure_outbox_table()
+    standings.ensure_standings_tables()
+
+    placeholders = ", ".join(["%s"] * len(game_ids))
+    with session(dictionary=True) as cursor:
+        cursor.execute(f"SELECT game_id, response_hash FROM scoring_cursor WHERE game_id IN ({placeholders})", list(game_ids))
+        for row in cursor.fetchall():
+            cursors[row['game_id']]["response_hash"] = row['response_hash']
+
+        cursor.execute(f"SELECT game_id, play_fingerprint FROM scored_plays WHERE game_id IN ({placeholders})", list(game_ids))
+        for row in cursor.fetchall():
+            cursors[row['game_id']]["seen"].add(row['play_fingerprint'])
+
+    return cursors
+
+# Function to keep only the games whose box score changed, along with their not-yet-seen plays
+def find_new_plays(box_scores, cursors):
+    changes = {}
+    for game_id, box_score in box_scores.items():
+        cursor_state = cursors.get(game_id, {"response_hash": None, "seen": set()})
+        response_hash = box_score_hash(box_score)
+        if response_hash == cursor_state["response_hash"]:
+            logging.debug(f"Box score for game_id {game_id} is unchanged since the last poll. Skipping.")
+            continue
+
+        new_plays = []
+        for play in box_score.get("scoringPlays", []):
+            fingerprint = play_fingerprint(play)
+            if fingerprint not in cursor_state["seen"]:
+                new_plays.append((fingerprint, play))
+
+        changes[game_id] = {
+            "response_hash": response_hash,
+            "new_plays": new_plays,
+            "plays_seen": len(cursor_state["seen"]) + len(new_plays),
         }
+    return changes
 
-        response = requests.get(api_url, headers=headers, params=querystring)
-
-        if response.status_code == 200:
-            api_calls += 1  # Increment API call count
-            logging.info(f"Successfully fetched game data for game_id {game_id}. API call count: {api_calls}")
-
-            game_data = response.json()
-            scoring_plays = game_data["body"].get("scoringPlays", [])
-            game_status = game_data["body"].get("gameStatus", "Unknown")
-            game_status_code = game_data["body"].get("gameStatusCode", 0)
-
-            # Update the game status and status code in the database
-            cursor.execute('''
-                UPDATE games 
-                SET game_status = %s, game_status_code = %s, last_updated = CURRENT_TIMESTAMP 
-                WHERE game_id = %s
-            ''', (game_status, game_status_code, game_id))
-            logging.info(f"Updated game status for game_id {game_id}: status={game_status}, status_code={game_status_code}")
-
-            # Check if the player has scored a touchdown (TD)
-            for play in scoring_plays:
-                if play["scoreType"] == "TD" and str(player_id) in play["playerIDs"]:
-                    # If player scored, update the 'is_successful' column to 1 only once
-                    cursor.execute(
-                        'UPDATE picks SET is_successful = 1 WHERE id = %s',
-                        (pick_id,)
-                    )
-                    logging.info(f"Player {player_id} scored in game {game_id}! Updated pick {pick_id} to successful.")
-
-                    # Update leaderboard points only once per player, per pick
-                    cursor.execute('''
-                        UPDATE leaderboard
-                        SET points_week = points_week + 1, total_points = total_points + 1, last_updated = CURRENT_TIMESTAMP
-                        WHERE user_id = %s AND week = %s AND points_week = 0
-                    ''', (pick['user_id'], pick['week']))
-                    logging.info(f"Updated leaderboard for user_id {pick['user_id']} in week {pick['week']}: incremented points.")
-
-                    # Fetch the user IDs who picked the player
-                    cursor.execute("""
-                        SELECT user_id FROM picks WHERE player_id = %s AND is_successful = 1
-                    """, (player_id,))
-                    tagged_users = [row['user_id'] for row in cursor.fetchall()]
-
-                    # Trigger the webhook to notify users about the touchdown
-                    if tagged_users:
-                        send_touchdown_notification(play.get("playerName"), tagged_users)
+# Function to index pending picks by (game_id, player_id) so each play can be matched with dictionary lookups
+def build_pick_index(picks_by_game):
+    pick_index = defaultdict(list)
+    for game_id, picks in picks_by_game.items():
+        for pick in picks:
+            pick_index[(game_id, str(pick['player_id']))].append(pick)
+    return pick_index
 
-        else:
-            logging.error(f"Failed to fetch game data for game_id {game_id}. Status code: {response.status_code}")
+# Function to split a play's playerIDs into individual IDs, whether the API sent a list or a delimited string
+def tokenize_player_ids(player_ids):
+    if isinstance(player_ids, str):
+        return {token for token in player_ids.replace(",", " ").split() if token}
+    return {str(player_id) for player_id in player_ids or []}
+
+# Function to work out which pending picks scored a touchdown in the new scoring plays.
+# Also returns one touchdown event per (play, scorer), tagging only the users whose pick that play resolved.
+def find_scoring_picks(picks_by_game, changes):
+    scored_picks = {}
+    touchdowns = []
+    pick_index = build_pick_index(picks_by_game)
+
+    for game_id, change in changes.items():
+        for fingerprint, play in change["new_plays"]:
+            if play["scoreType"] != "TD":
+                continue
+            # Resolve every pick hit by this play in one pass over its player IDs
+            for player_id in tokenize_player_ids(play.get("playerIDs")):
+                tagged_users = []
+                for pick in pick_index.get((game_id, player_id), []):
+                    if pick['id'] not in scored_picks:
+                        scored_picks[pick['id']] = pick
+                        tagged_users.append(pick['user_id'])
+                if tagged_users:
+                    touchdowns.append({
+                        "game_id": game_id,
+                        "fingerprint": fingerprint,
+                        "player_id": player_id,
+                        "player_name": play.get("playerName"),
+                        "tagged_users": tagged_users,
+                    })
+
+    return scored_picks, touchdowns
+
+# Function to turn touchdown events into outbox notifications, keyed so a play is never announced twice
+def touchdown_notifications(touchdowns):
+    return [
+        (
+            f"td:{touchdown['game_id']}:{touchdown['fingerprint']}:{touchdown['player_id']}",
+            "touchdown",
+            {"playerName": touchdown["player_name"], "taggedUsers": touchdown["tagged_users"]},
+        )
+        for touchdown in touchdowns
+    ]
+
+# Function to apply all pick, leaderboard, standings, game status, cursor and notification writes in one short transaction
+def apply_scoring_results(picks_by_game, box_scores, cursors):
+    # Work out every write up front so the transaction only holds locks for the statements themselves
+    changes = find_new_plays(box_scores, cursors)
+    if not changes:
+        logging.info("No box scores changed since the last poll.")
+        return 0
+
+    game_updates = [
+        (box_scores[game_id].get("gameStatus", "Unknown"), seasonCalendar.game_status_code(box_scores[game_id]), game_id)
+        for game_id in changes
+    ]
+    cursor_updates = [(game_id, change["response_hash"], change["plays_seen"]) for game_id, change in changes.items()]
+    seen_plays = [
+        (game_id, fingerprint, play.get("scoreType"))
+        for game_id, change in changes.items()
+        for fingerprint, play in change["new_plays"]
+    ]
+    scored_picks, touchdowns = find_scoring_picks(picks_by_game, changes)
+    notifications = touchdown_notifications(touchdowns)
+
+    with session(dictionary=True) as cursor:
+        # Update the game status and status code in the database
+        cursor.executemany('''
+            UPDATE games
+            SET game_status = %s, game_status_code = COALESCE(%s, game_status_code), last_updated = CURRENT_TIMESTAMP
+            WHERE game_id = %s
+        ''', game_updates)
+        logging.info(f"Updated game status for {len(game_updates)} games.")
+
+        if scored_picks:
+            # Lock the picks that are still pending, an overlapping run may already have credited some of them
+            pick_ids = list(scored_picks)
+            placeholders = ", ".join(["%s"] * len(pick_ids))
+            cursor.execute(f'SELECT id FROM picks WHERE id IN ({placeholders}) AND is_successful = 0 FOR UPDATE', pick_ids)
+            scored_picks = {row['id']: scored_picks[row['id']] for row in cursor.fetchall()}
+
+        if scored_picks:
+            # Mark every pick whose player scored as successful
+            pick_ids = list(scored_picks)
+            placeholders = ", ".join(["%s"] * len(pick_ids))
+            cursor.execute(f'UPDATE picks SET is_successful = 1 WHERE id IN ({placeholders}) AND is_successful = 0', pick_ids)
+            for pick in scored_picks.values():
+                logging.info(f"Player {pick['player_id']} scored in game {pick['game_id']}! Updated pick {pick['id']} to successful.")
+
+            # Update leaderboard points only once per user, per week
+            leaderboard_updates = sorted({(pick['user_id'], pick['week']) for pick in scored_picks.values()})
+            cursor.executemany('''
+                UPDATE leaderboard
+                SET points_week = points_week + 1, total_points = total_points + 1, last_updated = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND week = %s AND points_week = 0
+            ''', leaderboard_updates)
+            logging.info(f"Updated leaderboard for {len(leaderboard_updates)} user/week entries: incremented points.")
+
+            # Keep the materialized standings the leaderboard job reads in step with the new points
+            standings.record_scoring_events(cursor, scored_picks.values())
+
+            # Queue the touchdown notifications in the same transaction, they are delivered after commit
+            outbox.enqueue(cursor, notifications)
+
+        # Record the plays we have now processed so the next poll only looks at newer ones
+        if seen_plays:
+            cursor.executemany('''
+                INSERT IGNORE INTO scored_plays (game_id, play_fingerprint, score_type)
+                VALUES (%s, %s, %s)
+            ''', seen_plays)
+        cursor.executemany('''
+            INSERT INTO scoring_cursor (game_id, response_hash, plays_seen)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE response_hash = VALUES(response_hash), plays_seen = VALUES(plays_seen)
+        ''', cursor_updates)
+        logging.info(f"Processed {len(seen_plays)} new scoring plays across {len(changes)} changed games.")
 
-    db.commit()
     logging.info("Database commit successful after processing all picks.")
-    cursor.close()
-    db.close()
 
-    # Update API usage table with the number of API calls made
-    update_api_usage(api_calls)
-    logging.info(f"API usage updated after making {api_calls} API calls.")
+    return len(notifications)
+
+# Asynchronous function to run the full scoring pipeline for the pending picks, optionally limited to some games
+async def run_scoring_pipeline(game_ids=None):
+    picks = await asyncio.to_thread(load_pending_picks, game_ids)
+
+    # Group the picks so every game is only looked up once
+    picks_by_game = group_picks_by_game(picks)
+    if not picks_by_game:
+        logging.info("No pending picks to process.")
+        return picks_by_game, {}
+    logging.info(f"Pending picks span {len(picks_by_game)} games.")
+
+    # Fetch every distinct box score concurrently, outside of any transaction
+    cursors = await asyncio.to_thread(load_scoring_cursors, list(picks_by_game))
+    box_scores = await fetch_box_scores(list(picks_by_game))
+
+    try:
+        # Apply all writes in a single short transaction, touchdown webhooks are queued in the outbox
+        queued = await asyncio.to_thread(apply_scoring_results, picks_by_game, box_scores, cursors)
+        if queued:
+            logging.info(f"Queued {queued} touchdown notifications for delivery.")
+    finally:
+        # Write the API calls made by this run in one atomic increment
+        await asyncio.to_thread(apiUsage.flush_api_usage)
+
+    return picks_by_game, box_scores
+
+# Asynchronous function to run one scoring pass, deliver its notifications and close the sessions before the event loop ends
+async def run_scoring_job():
+    try:
+        await run_scoring_pipeline()
+        # Scoring is already committed, so a slow webhook receiver only delays this job's exit
+        await outbox.drain_outbox()
+    finally:
+        await tank01.close_session()
+        await close_async_pool()
+
+# Function to check if a player has scored and update the game status
+def check_player_scores_and_update_game_status():
+    if not apiBudget.should_run("scorepicks", SCORE_PICKS_INTERVAL_MINUTES):
+        return
+    asyncio.run(run_scoring_job())
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename="logs/score_picks.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
 
-# Call the function to check scores and update game status
-logging.info("Starting to check player scores and update game status.")
-check_player_scores_and_update_game_status()
-logging.info("Completed checking player scores and updating game status.")
\ No newline at end of file
+    # Call the function to check scores and update game status
+    logging.info("Starting to check player scores and update game status.")
+    with jobLock.single_flight("scoring") as should_run:
+        if should_run:
+            check_player_scores_and_update_game_status()
+    logging.info(f"Database pool stats: {pool_stats()}")
+    logging.info("Completed checking player scores and updating game status.")
@@ -0,0 +1,139 @@
+import os
+import re
+import bisect
+import logging
+from datetime import datetime
+from functools import lru_cache
+import pytz
+from dotenv import load_dotenv
+from database import session
+
+# Load environment variables
+load_dotenv()
+
+# Season the jobs work on, as Tank01 names it (the year the season starts in)
+NFL_SEASON = os.getenv("NFL_SEASON", "2024")
+
+# Tank01 reports kickoffs in Eastern time, the league runs on Irish time
+eastern = pytz.timezone("America/New_York")
+irish = pytz.timezone("Europe/Dublin")
+
+WEEK_PATTERN = re.compile(r"Week (\d+)")
+
+_calendars = {}
+
+# Function to parse a Tank01 game date (YYYYMMDD), once per distinct date
+@lru_cache(maxsize=None)
+def parse_game_date(game_date):
+    return datetime.strptime(game_date, "%Y%m%d").date()
+
+# Function to parse a Tank01 kickoff clock such as "8:15p" into (hour, minute), once per distinct value
+@lru_cache(maxsize=None)
+def parse_game_clock(game_time_et):
+    clock = datetime.strptime(game_time_et.replace("a", "AM").replace("p", "PM"), "%I:%M%p")
+    return clock.hour, clock.minute
+
+# Function to convert an ET game date and time to Irish time.
+# localize() picks the Eastern offset in force on that date, so kickoffs either side of a DST change are correct.
+@lru_cache(maxsize=None)
+def kickoff_time(game_date, game_time_et):
+    if game_time_et == "TBD" or not game_time_et or not game_date:
+        return None
+    try:
+        hour, minute = parse_game_clock(game_time_et)
+        kickoff_et = eastern.localize(datetime.combine(parse_game_date(game_date), datetime.min.time()).replace(hour=hour, minute=minute))
+        return kickoff_et.astimezone(irish)
+    except Exception as e:
+        logging.error(f"Error converting game time: {game_date} {game_time_et}. Error: {e}")
+        return None
+
+# Function to read a stored game_time, which may come back from the database as a DATETIME or as a string.
+# Returns the naive Irish wall-clock time it was stored as.
+def stored_game_time(game_time):
+    if game_time is None:
+        return None
+    if isinstance(game_time, str):
+        return datetime.fromisoformat(game_time)
+    return game_time.replace(tzinfo=None) if game_time.tzinfo else game_time
+
+# Function to convert the kickoff of every game in one pass, returning {game_id: Irish kickoff time or None}
+def convert_kickoffs(games):
+    return {game.get("gameID"): kickoff_time(game.get("gameDate"), game.get("gameTime")) for game in games}
+
+# Function to get the week number of a Tank01 game from its "Week N" label
+def game_week(game):
+    match = WEEK_PATTERN.search(game.get("gameWeek") or "")
+    return int(match.group(1)) if match else None
+
+# Function to read the Tank01 status code of a game or box score, or None when it is missing a usable one.
+# The API sends it as a string and has been seen to send "" or null while a game changes state.
+def game_status_code(game):
+    try:
+        return int(game.get("gameStatusCode", 0))
+    except (TypeError, ValueError):
+        return None
+
+# Function to build a calendar from (week, first game date) pairs: week starts sorted for bisect lookups
+def make_calendar(season, week_starts):
+    starts = {}
+    for week, start_date in week_starts:
+        if week is not None and start_date is not None:
+            starts[week] = min(start_date, starts.get(week, start_date))
+    ordered = sorted(starts.items(), key=lambda item: item[1])
+    return {
+        "season": str(season),
+        "weeks": [week for week, _ in ordered],
+        "starts": [start_date for _, start_date in ordered],
+    }
+
+# Function to build the calendar of a season from the Tank01 schedule, each week starting on the date of its first game
+def build_calendar(games, season=NFL_SEASON):
+    calendar = make_calendar(season, (
+        (game_week(game), parse_game_date(game["gameDate"]))
+        for game in games if game.get("gameDate")
+    ))
+    _calendars[str(season)] = calendar
+    return calendar
+
+# Function to load the calendar of a season from the games table, once per process
+def load_calendar(season=NFL_SEASON):
+    season = str(season)
+    if season in _calendars:
+        return _calendars[season]
+
+    with session() as cursor:
+        cursor.execute("""
+            SELECT week, MIN(game_time) FROM games
+            WHERE season = %s AND game_time IS NOT NULL
+            GROUP BY week
+        """, (season,))
+        rows = cursor.fetchall()
+
+    # game_time is stored in Irish time, week boundaries are Eastern dates like the schedule's
+    calendar = make_calendar(season, (
+        (week, irish.localize(stored_game_time(first_game)).astimezone(eastern).date())
+        for week, first_game in rows
+    ))
+    if not calendar["weeks"]:
+        logging.warning(f"No games stored for season {season}, the calendar is empty.")
+    _calendars[season] = calendar
+    return calendar
+
+# Function to find the week a date falls in, or None before the first week
+def week_for_date(calendar, day):
+    index = bisect.bisect_right(calendar["starts"], day) - 1
+    return calendar["weeks"][index] if index >= 0 else None
+
+# Function to find the week of a Tank01 game date (YYYYMMDD)
+def week_for_game_date(calendar, game_date):
+    if not game_date:
+        return None
+    return week_for_date(calendar, parse_game_date(game_date))
+
+# Function to find the current week of the calendar
+def current_week(calendar, today=None):
+    return week_for_date(calendar, today or datetime.now(eastern).date())
+
+# Function to get a team's bye week in the given season
+def bye_week(team, season=NFL_SEASON):
+    return team.get("byeWeeks", {}).get(str(season), [None])[0]
@@ -0,0 +1,204 @@
+import logging
+import argparse
+from dotenv import load_dotenv
+from database import session, pool_stats
+import jobLock
+
+# Load environment variables
+load_dotenv()
+
+CREATE_STANDINGS_TABLES_SQL = [
+    # One row per user, week and successful player, ranked within the week
+    """
+    CREATE TABLE IF NOT EXISTS standings (
+        user_id VARCHAR(64) NOT NULL,
+        week INT NOT NULL,
+        player_name VARCHAR(255) NOT NULL,
+        points INT NOT NULL DEFAULT 0,
+        week_rank INT NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, week, player_name),
+        KEY idx_standings_week_rank (week, week_rank)
+    )
+    """,
+    # A copy of every leaderboard row with its user's name, the rows the overall board has always listed
+    """
+    CREATE TABLE IF NOT EXISTS standings_overall (
+        user_id VARCHAR(64) NOT NULL,
+        week INT NOT NULL,
+        username VARCHAR(255) NOT NULL,
+        total_points INT NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, week),
+        KEY idx_standings_overall_points (total_points)
+    )
+    """,
+    # Single row bumped every time the standings change, so readers can tell whether anything is new
+    """
+    CREATE TABLE IF NOT EXISTS standings_version (
+        id TINYINT NOT NULL PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+UPSERT_WEEKLY_SQL = """
+    INSERT INTO standings (user_id, week, player_name, points)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE points = points + VALUES(points)
+"""
+
+RANK_WEEKS_SQL = """
+    UPDATE standings s
+    JOIN (
+        SELECT user_id, week, player_name, RANK() OVER (PARTITION BY week ORDER BY points DESC) AS week_rank
+        FROM standings
+        WHERE week IN ({placeholders})
+    ) ranked USING (user_id, week, player_name)
+    SET s.week_rank = ranked.week_rank
+"""
+
+BUMP_VERSION_SQL = """
+    INSERT INTO standings_version (id, version) VALUES (1, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1
+"""
+
+# Scoring only moves the version on once a rebuild has started it, until then it stays 0 so the next reader rebuilds
+BUMP_BUILT_VERSION_SQL = """
+    UPDATE standings_version SET version = version + 1 WHERE id = 1
+"""
+
+_standings_tables_ready = False
+
+# Function to create the standings tables if they do not exist yet (run before any transaction that updates them)
+def ensure_standings_tables():
+    global _standings_tables_ready
+    if _standings_tables_ready:
+        return
+    with session() as cursor:
+        for statement in CREATE_STANDINGS_TABLES_SQL:
+            cursor.execute(statement)
+    _standings_tables_ready = True
+
+# Function to copy the leaderboard rows of some users into standings_overall, the same rows the baseline overall board read
+def refresh_overall(cursor, user_ids=None):
+    where = ""
+    params = []
+    if user_ids is not None:
+        where = f"WHERE u.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+        params = list(user_ids)
+
+    cursor.execute(f"""
+        INSERT INTO standings_overall (user_id, week, username, total_points)
+        SELECT u.user_id, l.week, u.username, l.total_points
+        FROM users u
+        JOIN leaderboard l ON u.user_id = l.user_id
+        {where}
+        ON DUPLICATE KEY UPDATE username = VALUES(username), total_points = VALUES(total_points)
+    """, params)
+
+# Function to apply newly successful picks to the standings inside the scoring transaction.
+# Expects the leaderboard to have been updated already in the same transaction, and only the picks it just marked successful.
+def record_scoring_events(cursor, scored_picks):
+    scored_picks = list(scored_picks)
+    if not scored_picks:
+        return
+
+    player_ids = sorted({pick['player_id'] for pick in scored_picks})
+    cursor.execute(f"""
+        SELECT player_id, player_name FROM players WHERE player_id IN ({', '.join(['%s'] * len(player_ids))})
+    """, player_ids)
+    player_names = {str(row['player_id']): row['player_name'] for row in cursor.fetchall()}
+
+    weekly_points = {}
+    for pick in scored_picks:
+        key = (pick['user_id'], pick['week'], player_names.get(str(pick['player_id']), str(pick['player_id'])))
+        weekly_points[key] = weekly_points.get(key, 0) + 1
+    cursor.executemany(UPSERT_WEEKLY_SQL, [key + (points,) for key, points in sorted(weekly_points.items())])
+
+    weeks = sorted({pick['week'] for pick in scored_picks})
+    cursor.execute(RANK_WEEKS_SQL.format(placeholders=", ".join(["%s"] * len(weeks))), weeks)
+
+    # Only the scoring users' rows change, the overall order is worked out when the board is read
+    refresh_overall(cursor, sorted({pick['user_id'] for pick in scored_picks}))
+
+    cursor.execute(BUMP_BUILT_VERSION_SQL)
+    logging.info(f"Standings updated for {len(weekly_points)} user/week entries across weeks {weeks}.")
+
+# Function to read the current standings version (0 when the standings have never been built)
+def current_version():
+    ensure_standings_tables()
+    with session() as cursor:
+        cursor.execute("SELECT version FROM standings_version WHERE id = 1")
+        result = cursor.fetchone()
+    return result[0] if result else 0
+
+# Function to read the precomputed standings in display order
+def load_standings():
+    with session(dictionary=True) as cursor:
+        cursor.execute("""
+            SELECT week, player_name, 1 AS is_successful, points
+            FROM standings
+            ORDER BY week, week_rank, player_name
+        """)
+        weekly = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT username, total_points
+            FROM standings_overall
+            ORDER BY total_points DESC, username
+        """)
+        overall = cursor.fetchall()
+    return weekly, overall
+
+# Function to rebuild the standings from the full pick history, for the first run or after manual corrections
+def rebuild():
+    ensure_standings_tables()
+    with session(dictionary=True) as cursor:
+        cursor.execute("DELETE FROM standings")
+        cursor.execute("""
+            INSERT INTO standings (user_id, week, player_name, points)
+            SELECT p.user_id, p.week, pl.player_name, COUNT(*)
+            FROM picks p
+            JOIN players pl ON p.player_id = pl.player_id
+            WHERE p.is_successful = 1
+            GROUP BY p.user_id, p.week, pl.player_name
+        """)
+        weekly_rows = cursor.rowcount
+        cursor.execute("""
+            UPDATE standings s
+            JOIN (
+                SELECT user_id, week, player_name, RANK() OVER (PARTITION BY week ORDER BY points DESC) AS week_rank
+                FROM standings
+            ) ranked USING (user_id, week, player_name)
+            SET s.week_rank = ranked.week_rank
+        """)
+
+        cursor.execute("DELETE FROM standings_overall")
+        refresh_overall(cursor)
+        overall_rows = cursor.rowcount
+
+        cursor.execute(BUMP_VERSION_SQL)
+    logging.info(f"Rebuilt standings: {weekly_rows} weekly rows, {overall_rows} overall rows.")
+    return weekly_rows, overall_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the materialized leaderboard standings.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the standings from the full pick history")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename="logs/standings.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    if args.rebuild:
+        with jobLock.single_flight("standings") as should_run:
+            if should_run:
+                weekly_rows, overall_rows = rebuild()
+                print(f"Rebuilt standings: {weekly_rows} weekly rows, {overall_rows} overall rows.")
+                logging.info(f"Database pool stats: {pool_stats()}")
+    else:
+        print(f"Standings version: {current_version()}")
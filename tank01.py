@@ -0,0 +1,281 @@
+import aiohttp
+import asyncio
+import os
+import re
+import time
+import json
+import codecs
+import random
+import logging
+from dotenv import load_dotenv
+import apiUsage
+import instrumentation
+import responseCache
+
+# Load environment variables
+load_dotenv()
+
+TANK01_HOST = "tank01-nfl-live-in-game-real-time-statistics-nfl.p.rapidapi.com"
+BASE_URL = os.getenv("TANK01_BASE_URL", f"https://{TANK01_HOST}")
+
+# Total request timeout in seconds for each endpoint, the full player list is by far the largest response
+ENDPOINT_TIMEOUTS = {
+    "getNFLTeams": 20,
+    "getNFLPlayerList": 60,
+    "getNFLGamesForWeek": 30,
+    "getNFLBoxScore": 15,
+}
+DEFAULT_TIMEOUT = 30
+
+# Retry settings for rate limiting and server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.getenv("TANK01_MAX_RETRIES", "3"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10.0
+
+# Connection reuse settings
+MAX_CONNECTIONS = int(os.getenv("TANK01_MAX_CONNECTIONS", "10"))
+DEFAULT_CONCURRENCY = int(os.getenv("TANK01_CONCURRENCY", "5"))
+
+# Streamed responses are read and parsed in chunks of this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+BODY_ARRAY_START = re.compile(r'"body"\s*:\s*\[')
+
+_session = None
+
+# Asynchronous function to get the shared keep-alive session, creating it on first use
+async def get_session():
+    global _session
+    if _session is None or _session.closed:
+        if not os.getenv("RAPIDAPI_KEY"):
+            logging.error("Environment variable RAPIDAPI_KEY is missing, Tank01 requests will be rejected.")
+        connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, ttl_dns_cache=300, keepalive_timeout=60)
+        headers = {
+            "x-rapidapi-key": os.getenv("RAPIDAPI_KEY", ""),
+            "x-rapidapi-host": os.getenv("RAPIDAPI_HOST", TANK01_HOST),
+            "Accept-Encoding": "gzip, deflate",
+        }
+        _session = aiohttp.ClientSession(connector=connector, headers=headers)
+    return _session
+
+# Asynchronous function to close the shared session, called once when a job finishes
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+# Function to work out how long to wait before retrying, honouring Retry-After when the API sends it
+def backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP * 3)
+        except ValueError:
+            pass
+    # Full jitter so parallel requests do not retry in lockstep
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+# Asynchronous function to send a request with retries, returning the open 200/304 response (the caller releases it) or None.
+# With `read`, the body is read inside the retry loop and (status, read(response), headers) is returned instead.
+async def open_response(endpoint, params=None, headers=None, read=None):
+    session = await get_session()
+    url = f"{BASE_URL}/{endpoint}"
+    timeout = aiohttp.ClientTimeout(total=ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT))
+
+    for attempt in range(MAX_RETRIES + 1):
+        retry_after = None
+        start = time.perf_counter()
+        try:
+            response = await session.get(url, params=params, headers=headers, timeout=timeout)
+            apiUsage.record_api_call(endpoint)
+            instrumentation.record_http("tank01", endpoint, response.status, time.perf_counter() - start)
+            if response.status in (200, 304):
+                if read is None:
+                    return response
+                async with response:
+                    return response.status, await read(response), response.headers
+
+            async with response:
+                error_text = await response.text()
+            if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                logging.error(f"Failed to fetch {endpoint}: {response.status} - {error_text}")
+                return None
+            retry_after = response.headers.get("Retry-After")
+            logging.warning(f"{endpoint} returned {response.status}, retrying (attempt {attempt + 1} of {MAX_RETRIES}).")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            instrumentation.record_http("tank01", endpoint, type(e).__name__, time.perf_counter() - start)
+            if attempt == MAX_RETRIES:
+                logging.error(f"Error fetching {endpoint} from API: {e!r}")
+                return None
+            logging.warning(f"Error fetching {endpoint} ({e!r}), retrying (attempt {attempt + 1} of {MAX_RETRIES}).")
+
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+    return None
+
+# Asynchronous function to read the "body" of a 200 response, None for a 304
+async def read_body(response):
+    if response.status == 304:
+        return None
+    response_data = await response.json()
+    return response_data.get("body")
+
+# Asynchronous function to send one request with retries, returning (status, body, response headers)
+async def request(endpoint, params=None, headers=None):
+    result = await open_response(endpoint, params, headers, read=read_body)
+    if result is None:
+        return None, None, {}
+    if result[0] == 200:
+        logging.info(f"Successfully fetched {endpoint} from API")
+    return result
+
+# Asynchronous function to call a Tank01 endpoint and return the "body" of its response, or None on failure.
+# Slow-changing endpoints are served from the on-disk cache while fresh, revalidated when stale,
+# and the stale copy is used if the API is failing.
+async def fetch(endpoint, params=None, use_cache=True):
+    ttl = responseCache.ttl_for(endpoint) if use_cache else None
+    entry = None
+    if ttl:
+        entry = await asyncio.to_thread(responseCache.load, endpoint, params)
+        if entry and responseCache.is_fresh(entry, ttl):
+            logging.info(f"Using cached {endpoint} ({responseCache.age_of(entry)}s old)")
+            return entry.get("body")
+
+    status, body, response_headers = await request(endpoint, params, responseCache.validator_headers(entry))
+
+    if status == 200:
+        if ttl and body is not None:
+            await asyncio.to_thread(
+                responseCache.store, endpoint, params, body,
+                response_headers.get("ETag"), response_headers.get("Last-Modified")
+            )
+        return body
+
+    if entry and status == 304:
+        logging.info(f"{endpoint} has not changed since it was cached, reusing it")
+        await asyncio.to_thread(responseCache.refresh, endpoint, params, entry)
+        return entry.get("body")
+
+    if entry:
+        logging.warning(f"Serving stale cached {endpoint} ({responseCache.age_of(entry)}s old) after the API call failed")
+        return entry.get("body")
+
+    return None
+
+# Asynchronous generator over the items of the top-level "body" array in a stream of byte chunks.
+# Yields (item, raw_json) one at a time, so only the item being parsed is ever held in memory.
+async def iter_body_items(chunks):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    in_array = False
+
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        if not in_array:
+            match = BODY_ARRAY_START.search(buffer)
+            if not match:
+                continue
+            pos = match.end()
+            in_array = True
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # The item continues in the next chunk
+                break
+            yield item, buffer[pos:end]
+            pos = end
+
+        buffer = buffer[pos:]
+        pos = 0
+
+    if in_array:
+        raise ValueError("Response ended before the body array was complete")
+    raise ValueError("Response has no body array")
+
+# Asynchronous generator reading a file in chunks without blocking the event loop
+async def iter_file_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+# Asynchronous generator over the items of an endpoint's "body" array, parsed incrementally from the response.
+# Uses the on-disk cache like fetch(), writing the new cache entry item by item as the response streams in.
+# Yields nothing if the request fails and there is no cached copy.
+async def stream(endpoint, params=None, use_cache=True):
+    ttl = responseCache.ttl_for(endpoint) if use_cache else None
+    path = responseCache.cache_path(endpoint, params)
+    header = None
+    if ttl:
+        header = await asyncio.to_thread(responseCache.load_header, endpoint, params)
+        if header and responseCache.is_fresh(header, ttl):
+            logging.info(f"Streaming cached {endpoint} ({responseCache.age_of(header)}s old)")
+            async for item, _ in iter_body_items(iter_file_chunks(path)):
+                yield item
+            return
+
+    response = await open_response(endpoint, params, responseCache.validator_headers(header))
+    if response is None:
+        if header:
+            logging.warning(f"Serving stale cached {endpoint} ({responseCache.age_of(header)}s old) after the API call failed")
+            async for item, _ in iter_body_items(iter_file_chunks(path)):
+                yield item
+        return
+
+    async with response:
+        if response.status == 304:
+            logging.info(f"{endpoint} has not changed since it was cached, reusing it")
+            source = iter_file_chunks(path)
+            etag, last_modified = header.get("etag"), header.get("last_modified")
+        else:
+            logging.info(f"Streaming {endpoint} from API")
+            source = response.content.iter_chunked(STREAM_CHUNK_SIZE)
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+        writer = responseCache.open_stream_entry(endpoint, params, etag, last_modified) if ttl else None
+        complete = False
+        yielded = 0
+        try:
+            async for item, raw in iter_body_items(source):
+                if writer:
+                    responseCache.write_stream_item(writer, raw)
+                yield item
+                yielded += 1
+            complete = True
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"Error reading {endpoint} from API after {yielded} items: {e!r}")
+        finally:
+            if writer:
+                responseCache.close_stream_entry(writer, complete)
+
+    # The incomplete entry was discarded, so the cached copy is still the previous one
+    if not complete and not yielded and header and response.status == 200:
+        logging.warning(f"Serving stale cached {endpoint} ({responseCache.age_of(header)}s old) after the API call failed")
+        async for item, _ in iter_body_items(iter_file_chunks(path)):
+            yield item
+
+# Asynchronous function to run independent endpoint calls in parallel, e.g. gather(fetch("getNFLTeams"), fetch(...))
+async def gather(*calls):
+    return await asyncio.gather(*calls)
+
+# Asynchronous function to fetch many (endpoint, params) pairs with at most `limit` requests in flight
+async def fetch_many(requests, limit=DEFAULT_CONCURRENCY, use_cache=True):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded_fetch(endpoint, params):
+        async with semaphore:
+            return await fetch(endpoint, params, use_cache=use_cache)
+
+    return await asyncio.gather(*(bounded_fetch(endpoint, params) for endpoint, params in requests))
@@ -0,0 +1,49 @@
+import json
+import asyncio
+import tracemalloc
+
+import tank01
+import rosterSync
+from bench_player_stream import build_payload, replay_chunks, parse_whole, parse_streamed, traced_peak
+
+PLAYERS = 3000
+TEAM_MAPPING = {f"T{t:02d}": t % 14 + 5 for t in range(32)}
+
+
+# Streaming the player list must build the same rows as decoding the whole document
+def test_streamed_rows_match_whole_document():
+    payload = build_payload(200, seed=3)
+    whole = [rosterSync.player_row(player, TEAM_MAPPING) for player in json.loads(payload)["body"]]
+
+    async def collect():
+        rows = []
+        items = (item async for item, _ in tank01.iter_body_items(replay_chunks(payload, 1024)))
+        async for batch in rosterSync.stream_batches(items, 50):
+            rows.extend(rosterSync.player_row(player, TEAM_MAPPING) for player in batch)
+        return rows
+
+    assert asyncio.run(collect()) == whole
+
+
+# Function to measure the whole-document and streamed peaks for a player list of the given size
+def measure_peaks(players):
+    payload = build_payload(players, seed=7)
+    whole_rows, whole_peak = traced_peak(lambda: parse_whole(payload, TEAM_MAPPING))
+    streamed_rows, streamed_peak = traced_peak(
+        lambda: asyncio.run(parse_streamed(payload, TEAM_MAPPING, tank01.STREAM_CHUNK_SIZE, rosterSync.ROSTER_SYNC_CHUNK_SIZE))
+    )
+    assert whole_rows == streamed_rows == players
+    assert not tracemalloc.is_tracing()
+    return whole_peak, streamed_peak
+
+
+# Peak memory while streaming must be below decoding the whole response, and must not grow with the response
+def test_streaming_lowers_peak_memory():
+    whole_peak, streamed_peak = measure_peaks(PLAYERS)
+    assert streamed_peak < whole_peak, f"streamed peak {streamed_peak} B is not below the whole-body peak {whole_peak} B"
+
+    larger_whole_peak, larger_streamed_peak = measure_peaks(PLAYERS * 3)
+    assert larger_whole_peak > whole_peak * 2
+    # A chunk and a batch are in memory at a time, however many players the response has
+    assert larger_streamed_peak < streamed_peak * 1.25
+    assert larger_streamed_peak * 4 < larger_whole_peak